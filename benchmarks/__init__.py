@@ -0,0 +1,16 @@
+"""Performance benchmarks.
+
+The bench_*.py modules with test functions are pytest-benchmark suites, a dev
+dependency, they are not collected by the test run and have to be passed
+explicitly:
+
+    python -m pytest benchmarks/bench_*.py --benchmark-autosave
+
+Saved results are stored in .benchmarks/, tagged with the commit they were
+run on. Compare a run with the previous ones, and fail on regressions:
+
+    python -m pytest benchmarks/bench_*.py --benchmark-compare \\
+        --benchmark-compare-fail=median:10%
+
+The other modules are standalone scripts, run with `python -m benchmarks.NAME`.
+"""
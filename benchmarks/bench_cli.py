@@ -0,0 +1,56 @@
+"""Cold start time of the clinja subcommands, each run in a fresh python
+process with a temporary config directory.
+
+Usage:
+    python -m pytest benchmarks/bench_cli.py
+"""
+
+import os
+import subprocess
+
+import pytest
+
+from .bench_startup import CLINJA, COMMANDS
+
+
+@pytest.fixture(scope="module")
+def env(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp("config")
+    (tmp_dir / "template").write_text("{{ var }}")
+    env = {
+        **os.environ,
+        "XDG_CONFIG_HOME": str(tmp_dir),
+        "PYTHONPATH": os.pathsep.join(
+            [
+                os.path.dirname(os.path.dirname(__file__)),
+                os.environ.get("PYTHONPATH", ""),
+            ]
+        ),
+    }
+    run(["add", "var", "value"], env)
+    return env
+
+
+def run(args, env):
+    subprocess.run(
+        CLINJA + args,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+@pytest.mark.parametrize("name", COMMANDS.keys())
+def test_cold_start(benchmark, env, name):
+    cmd_env = env
+    if name == "tab completion":
+        cmd_env = {
+            **env,
+            "_CLINJA_COMPLETE": "bash_complete",
+            "COMP_WORDS": "clinja list ",
+            "COMP_CWORD": "2",
+        }
+    template = os.path.join(env["XDG_CONFIG_HOME"], "template")
+    args = [a.format(template=template) for a in COMMANDS[name]]
+    benchmark.pedantic(run, args=(args, cmd_env), rounds=5, warmup_rounds=1)
@@ -0,0 +1,27 @@
+"""Variable name completion latency, with an up to date and a stale index.
+
+Usage:
+    python -m pytest benchmarks/bench_completion.py
+"""
+
+import os
+
+from clinja.completions import VariableIndex
+
+
+def test_prefixed(benchmark, static_file):
+    VariableIndex(static_file=static_file).prefixed("var_1")
+    benchmark(lambda: VariableIndex(static_file=static_file).prefixed("var_1"))
+
+
+def test_prefixed_stale(benchmark, static_file):
+    def touch():
+        # a changed static file invalidates the index
+        stat = static_file.stat()
+        os.utime(static_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    benchmark.pedantic(
+        lambda: VariableIndex(static_file=static_file).prefixed("var_1"),
+        setup=touch,
+        rounds=10,
+    )
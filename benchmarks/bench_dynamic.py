@@ -0,0 +1,57 @@
+"""ClinjaDynamic.run overhead, with an empty and a heavy dynamic file.
+
+test_run executes the dynamic file on each call, test_run_memo measures the
+reuse of the results within a process.
+
+Usage:
+    python -m pytest benchmarks/bench_dynamic.py
+"""
+
+import pytest
+
+from clinja.clinja import ClinjaDynamic
+
+DYNAMIC_FILES = {
+    "empty": "",
+    "heavy": """\
+import json
+import hashlib
+
+for i in range(10000):
+    DYNAMIC_VARS[f"var_{i}"] = hashlib.sha256(str(i).encode()).hexdigest()
+DYNAMIC_VARS["static"] = json.dumps(STATIC_VARS)
+""",
+    "providers": """\
+for i in range(100):
+    DYNAMIC_PROVIDERS[f"var_{i}"] = lambda i=i: i
+""",
+}
+
+
+@pytest.fixture(params=DYNAMIC_FILES.keys())
+def dynamic_file(request, tmp_path):
+    path = tmp_path / "dynamic.py"
+    path.write_text(DYNAMIC_FILES[request.param])
+    return path
+
+
+def test_run(benchmark, dynamic_file):
+    dynamic = ClinjaDynamic(dynamic_file=dynamic_file, memoize=False)
+    benchmark(dynamic.run, static_vars={"a": 1})
+
+
+def test_run_memo(benchmark, dynamic_file):
+    dynamic = ClinjaDynamic(dynamic_file=dynamic_file)
+    dynamic.run(static_vars={"a": 1})
+    benchmark(dynamic.run, static_vars={"a": 1})
+
+
+def test_run_cached(benchmark, dynamic_file, tmp_path):
+    dynamic = ClinjaDynamic(
+        dynamic_file=dynamic_file,
+        cache_ttl=3600,
+        cache_dir=tmp_path / "cache",
+        memoize=False,
+    )
+    dynamic.run(static_vars={"a": 1})
+    benchmark(dynamic.run, static_vars={"a": 1})
@@ -0,0 +1,46 @@
+"""Compare the old double parse of a template with the single parse of
+`clinja.utils.Template`.
+
+Usage:
+    python -m benchmarks.bench_parse [SIZE_MB]
+"""
+
+import sys
+from io import StringIO
+from timeit import repeat
+
+from jinja2 import Template
+from jinja2.meta import find_undeclared_variables
+
+from clinja.utils import Template as ClinjaTemplate
+
+BLOCK = """\
+{{ name }} {{ email }}
+{% if flag %}some text {{ value }}{% endif %}
+{% for item in items %}{{ item }}, {% endfor %}
+"""
+
+
+def make_template(size_mb: float) -> str:
+    return BLOCK * int(size_mb * 1024**2 / len(BLOCK))
+
+
+def double_parse(contents: str) -> set:
+    template = Template(contents)
+    return find_undeclared_variables(template.environment.parse(contents))
+
+
+def single_parse(contents: str) -> set:
+    return ClinjaTemplate(StringIO(contents)).get_vars()
+
+
+def main(size_mb: float = 1):
+    contents = make_template(size_mb)
+    print(f"template size: {len(contents) / 1024 ** 2:.1f} MB")
+    for func in (double_parse, single_parse):
+        best = min(repeat(lambda: func(contents), number=1, repeat=3))
+        print(f"{func.__name__}: {best:.3f} s")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
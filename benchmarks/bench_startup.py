@@ -0,0 +1,71 @@
+"""Cold start time of each clinja subcommand.
+
+Each subcommand is run in a fresh python process, with a temporary config
+directory.
+
+Usage:
+    python -m benchmarks.bench_startup [REPEAT]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+CLINJA = [sys.executable, "-c", "from clinja.cli import cli; cli(prog_name='clinja')"]
+COMMANDS = {
+    "--help": ["--help"],
+    "list": ["list"],
+    "completion": ["completion", "bash"],
+    "tab completion": [],
+    "test": ["test"],
+    "run": ["run", "{template}", "--prompt", "never"],
+}
+
+
+def time_command(args, env, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            CLINJA + args,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(repeat: int = 10):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template = Path(tmp_dir) / "template"
+        template.write_text("{{ var }}")
+        env = {
+            **os.environ,
+            "XDG_CONFIG_HOME": tmp_dir,
+            "PYTHONPATH": str(Path(__file__).resolve().parent.parent),
+        }
+        # create the config files
+        time_command(["list"], env, 1)
+        for name, args in COMMANDS.items():
+            cmd_env = env
+            if name == "tab completion":
+                cmd_env = {
+                    **env,
+                    "_CLINJA_COMPLETE": "bash_complete",
+                    "COMP_WORDS": "clinja list ",
+                    "COMP_CWORD": "2",
+                }
+            if name == "run":
+                time_command(["add", "var", "value"], env, 1)
+            args = [a.format(template=template) for a in args]
+            best = time_command(args, cmd_env, repeat)
+            print(f"{name}: {best * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,32 @@
+"""ClinjaStatic load, add, remove and list time, for each storage backend and
+number of stored variables.
+
+Usage:
+    python -m pytest benchmarks/bench_static.py
+"""
+
+from clinja.clinja import ClinjaStatic
+
+
+def test_load(benchmark, static_file):
+    benchmark(lambda: ClinjaStatic(static_file=static_file).stored)
+
+
+def test_add(benchmark, static_file):
+    static = ClinjaStatic(static_file=static_file)
+    benchmark(static.add, "new_var", "value", force=True)
+
+
+def test_remove(benchmark, static_file):
+    static = ClinjaStatic(static_file=static_file)
+    benchmark.pedantic(
+        static.remove,
+        args=("new_var",),
+        setup=lambda: static.add("new_var", "value", force=True),
+        rounds=20,
+    )
+
+
+def test_list(benchmark, static_file):
+    static = ClinjaStatic(static_file=static_file)
+    benchmark(lambda: [*static.list(pattern="^var_1")])
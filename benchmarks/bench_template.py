@@ -0,0 +1,55 @@
+"""Template parse, compile and render time across template sizes.
+
+Usage:
+    python -m pytest benchmarks/bench_template.py
+"""
+
+from io import StringIO
+
+import pytest
+from jinja2 import Environment
+
+from clinja.cache import TemplateCache
+from clinja.template import Template
+
+from .bench_parse import make_template
+
+SIZES_KB = [1, 16, 256]
+VARIABLES = {
+    "name": "name",
+    "email": "email",
+    "flag": True,
+    "value": 1,
+    "items": ["a", "b", "c"],
+}
+
+
+@pytest.fixture(params=SIZES_KB, ids=lambda size: f"{size}KB")
+def contents(request):
+    return make_template(request.param / 1024)
+
+
+def test_parse(benchmark, contents):
+    environment = Environment()
+    benchmark(environment.parse, contents)
+
+
+def test_compile(benchmark, contents):
+    environment = Environment()
+    ast = environment.parse(contents)
+    benchmark(environment.compile, ast)
+
+
+def test_template(benchmark, contents):
+    benchmark(lambda: Template(StringIO(contents)))
+
+
+def test_template_cached(benchmark, contents, tmp_path):
+    cache = TemplateCache(cache_dir=tmp_path)
+    Template(StringIO(contents), cache=cache)
+    benchmark(lambda: Template(StringIO(contents), cache=cache))
+
+
+def test_render(benchmark, contents):
+    template = Template(StringIO(contents))
+    benchmark(lambda: template.dump(VARIABLES, StringIO()))
@@ -0,0 +1,37 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from clinja.storage import open_storage
+
+# number of stored static variables
+STATIC_SIZES = [10, 1000, 100_000]
+
+
+def make_static(path: Path, size: int) -> Path:
+    """Create a static storage with `size` variables.
+
+    Args:
+        path: Path of the storage, its suffix selects the backend.
+        size: Number of variables.
+
+    Returns:
+        The path of the storage.
+    """
+    values = {f"var_{i}": f"value {i}" for i in range(size)}
+    if path.suffix == ".json":
+        path.write_text(json.dumps(values))
+    else:
+        open_storage(path).update(values)
+    return path
+
+
+@pytest.fixture(params=[".json", ".db"], ids=["json", "sqlite"])
+def static_suffix(request):
+    return request.param
+
+
+@pytest.fixture(params=STATIC_SIZES, ids=lambda size: f"{size}keys")
+def static_file(request, tmp_path, static_suffix):
+    return make_static(tmp_path / f"static{static_suffix}", request.param)
@@ -1,4 +1,20 @@
-from .clinja import ClinjaDynamic, ClinjaStatic
+import sys
+
+# imported first, to measure the startup time
+from . import profiling  # noqa: F401
 
 __version__ = "1.1.0"
 __author__ = "Loic Coyle <loic.coyle@hotmail.fr>"
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        # import on access, to keep the cli's startup fast
+        if name in ("ClinjaDynamic", "ClinjaStatic"):
+            from . import clinja
+
+            return getattr(clinja, name)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+else:  # pragma: no cover
+    from .clinja import ClinjaDynamic, ClinjaStatic
@@ -0,0 +1,147 @@
+import marshal
+import os
+import sys
+from hashlib import sha256
+from pathlib import Path
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+from .settings import TEMPLATE_CACHE_DIR, TEMPLATE_CACHE_MAX_SIZE
+
+
+class TemplateCache:
+    def __init__(
+        self,
+        cache_dir: Path = TEMPLATE_CACHE_DIR,
+        max_size: int = TEMPLATE_CACHE_MAX_SIZE,
+    ):
+        """On disk cache of compiled templates, with LRU eviction.
+
+        Args:
+            cache_dir: Directory in which to store the compiled templates.
+            max_size: Maximum size of the cache, in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _path(self, contents: str) -> Path:
+        """Path of the cache entry of a template.
+
+        The key depends on the template contents, the jinja version and the
+        python version, as the compiled code is not portable across versions.
+
+        Args:
+            contents: Contents of the template.
+
+        Returns:
+            Path of the cache entry.
+        """
+        from jinja2 import __version__ as jinja_version
+
+        key = sha256(
+            f"{jinja_version}\0{sys.version}\0{contents}".encode("utf8")
+        ).hexdigest()
+        return self.cache_dir / key
+
+    def _entries(self):
+        if not self.cache_dir.is_dir():
+            return []
+        # skip the temporary files of ongoing writes
+        return [
+            p
+            for p in self.cache_dir.iterdir()
+            if p.is_file() and not p.name.startswith(".")
+        ]
+
+    def get(
+        self, contents: str
+    ) -> Optional[Tuple[set, CodeType, List[Optional[str]], Dict[str, Optional[str]]]]:
+        """Get the compiled code of a template.
+
+        Args:
+            contents: Contents of the template.
+
+        Returns:
+            The undeclared variables, compiled code, referenced templates and
+            digests of the referenced templates of the template, None if the
+            template is not in the cache.
+        """
+        path = self._path(contents)
+        try:
+            with open(path, "rb") as fp:
+                variables, code, references, digests = marshal.load(fp)
+            # the modification time is used as the access time for eviction
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return set(variables), code, references, digests
+
+    def set(
+        self,
+        contents: str,
+        variables: set,
+        code: CodeType,
+        references: List[Optional[str]] = [],
+        digests: Dict[str, Optional[str]] = {},
+    ):
+        """Store the compiled code of a template.
+
+        Args:
+            contents: Contents of the template.
+            variables: Undeclared variables of the template, including the ones
+                of the templates it references.
+            code: Compiled code of the template.
+            references: Names of the templates it includes or imports.
+            digests: Hex digest of each referenced template's source, the entry
+                is stale once they change.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(contents)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(tmp_path, "wb") as fp:
+            marshal.dump((sorted(variables), code, [*references], dict(digests)), fp)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in
+        `self.max_size`."""
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((path.stat(), path))
+            except FileNotFoundError:
+                pass
+        size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in sorted(entries, key=lambda x: x[0].st_mtime):
+            if size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+
+    def clear(self) -> int:
+        """Remove all the cache entries.
+
+        Returns:
+            The number of removed entries.
+        """
+        entries = self._entries()
+        for path in entries:
+            path.unlink()
+        return len(entries)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            The number of entries, the size and the maximum size of the cache.
+        """
+        entries = self._entries()
+        return {
+            "directory": self.cache_dir,
+            "entries": len(entries),
+            "size": sum(path.stat().st_size for path in entries),
+            "max_size": self.max_size,
+        }
@@ -1,30 +1,552 @@
 import sys
+from io import StringIO
+from itertools import chain
 from json import JSONDecodeError, loads
 from pathlib import Path
 from typing import Any
 
 import click
 
+from . import profiling
+from .cache import TemplateCache
+from .client import ClinjaClient
 from .clinja import ClinjaDynamic, ClinjaStatic
+from .manifest import Manifest
+from .storage import SQLITE_SUFFIXES
 from .completions import get_completions, variable_names, variable_value
 from .settings import (
     CONF_DIR,
+    DYNAMIC_CACHE_DIR,
+    DYNAMIC_CODE_CACHE_DIR,
     DYNAMIC_FILE,
     DYNAMIC_FILE_INIT,
+    MANIFEST_FILE,
+    SOCKET_FILE,
+    STATIC_DB_FILE,
     STATIC_FILE,
     STATIC_FILE_INIT,
+    TEMPLATE_CACHE_DIR,
+    get_static_file,
 )
 from .utils import (
+    STDIO,
     AliasedGroup,
-    Template,
     bold,
     err_exit,
     f_docstring,
+    get_prompt_vars,
+    guess_format,
+    io_path,
+    is_compiled,
     literal_eval_or_string,
+    load_variables,
     sanitize_variable_name,
     prompt_tty,
+    read_records,
+    walk_templates,
 )
 
+# errors of a dynamic source which timed out, or of the sandboxed dynamic
+# source when it exceeds its limits
+DYNAMIC_ERRORS = (TimeoutError, MemoryError, RuntimeError)
+
+
+def exit_on_errors(errors):
+    """Report each error and exit if there are any."""
+    for error in errors:
+        err_exit(error, exit_code=0)
+    if errors:
+        sys.exit(1)
+
+
+def default_dynamic(obj):
+    """Check if the dynamic source runs with the default options."""
+    dynamic = obj.get("dynamic")
+    return dynamic is None or (
+        dynamic.worker is None
+        and dynamic.cache_ttl is None
+        and dynamic.provider_timeout is None
+    )
+
+
+def run_client(
+    client,
+    template,
+    destination,
+    prompt,
+    dry_run,
+    skip_unchanged=False,
+    answers=None,
+    include_paths=(),
+):
+    """Forward a run to the clinja daemon, prompting locally if needed."""
+    with click.open_file(str(template), "r") as fp:
+        contents = fp.read()
+    request = dict(
+        template=contents,
+        template_path=None if template == STDIO else str(template.resolve()),
+        destination_path=None if destination == STDIO else str(destination.resolve()),
+        run_cwd=str(Path.cwd()),
+        prompt=prompt,
+        dry_run=dry_run,
+        skip_unchanged=skip_unchanged,
+        search_path=[str(p) for p in template_search_path(template, include_paths)],
+    )
+    if answers:
+        request["preset"] = answers
+    response = client.request("run", **request)
+    if "prompt" in response:
+        # the daemon serves one connection at a time, don't hold it while
+        # prompting
+        client.close()
+        answers = {}
+        for var, default in response["prompt"]:
+            value = prompt_tty(
+                bold(var),
+                default=default,
+                value_proc=prompt_value_check,
+                show_default=True,
+            )
+            # only send the changed values, the defaults might not survive
+            # the round trip
+            if value is not default:
+                answers[var] = value
+        if not client.connect():
+            err_exit("The clinja daemon stopped.")
+        response = client.request("run", **request, answers=answers)
+    if "error" in response:
+        err_exit(response["error"])
+    if "output" in response:
+        click.echo(response["output"], nl=False)
+    elif skip_unchanged and "written" in response:
+        report_writes(int(response["written"]), int(not response["written"]))
+
+
+def template_search_path(template, include_paths=()):
+    """Directories in which the included and imported templates are looked up:
+    the template's directory, or the template directory itself, then the
+    include paths."""
+    if template == STDIO:
+        root = Path.cwd()
+    elif template.is_dir():
+        root = template
+    else:
+        root = template.parent
+    return [root.resolve(), *(Path(p).resolve() for p in include_paths)]
+
+
+def read_answers(answers_file):
+    """Load the answers to the prompts, the format is guessed from the file's
+    extension."""
+    try:
+        with click.open_file(str(answers_file), "r") as fp:
+            return load_variables(fp, fmt=guess_format(answers_file))
+    except ImportError:
+        err_exit("Reading yaml files requires PyYAML, pip install pyyaml.")
+    except (OSError, ValueError) as e:
+        err_exit(f"Could not read {answers_file}: {e}")
+
+
+def source_variables(obj, template_vars, template, destination):
+    """Merge the static and dynamic variables.
+
+    Args:
+        obj: Clinja's context object.
+        template_vars: Variables used by the template(s).
+        template: Template path provided to the dynamic source.
+        destination: Destination path provided to the dynamic source.
+
+    Returns:
+        The variable names and values.
+
+    Raises:
+        TimeoutError: if a dynamic variable provider or the sandboxed dynamic
+            file timed out.
+        MemoryError: if the sandboxed dynamic file exceeded its memory limit.
+        RuntimeError: if the sandboxed dynamic file's worker died.
+    """
+    with profiling.phase("static"):
+        static_vars = obj["static"].stored
+    with profiling.phase("dynamic"):
+        dynamic_vars = profiling.profiled(
+            obj["dynamic"].run,
+            static_vars=static_vars,
+            template=template,
+            destination=destination,
+            variables=template_vars,
+        )
+    return {**static_vars, **dynamic_vars}
+
+
+def prompt_variables(all_vars, template_vars, prompt, provided=(), answers=None):
+    """Prompt for variable values.
+
+    Args:
+        all_vars: Known variable names and values, used as defaults.
+        template_vars: Variables used by the template(s).
+        prompt: When to prompt for variable values.
+        provided: Variables provided by other means, never prompted for.
+        answers: Answers given in advance, their variables are never prompted
+            for.
+
+    Returns:
+        The answers and the prompted values which differ from the known values.
+    """
+    answers = {} if answers is None else answers
+    prompt_vars = get_prompt_vars(
+        template_vars - set(provided) - answers.keys(), all_vars, prompt
+    )
+    if prompt == "never" and len(prompt_vars) > 0:
+        # only continue if there are no missing vars
+        err_exit(f"Missing {', '.join(map(repr, sorted(prompt_vars)))}.")
+
+    answers = {**answers}
+    with profiling.phase("prompt"):
+        for var in sorted(prompt_vars):
+            default = all_vars.get(var, None)
+            value = prompt_tty(
+                bold(var),
+                default=default,
+                value_proc=prompt_value_check,
+                show_default=True,
+            )
+            if value is not default:
+                answers[var] = value
+    return answers
+
+
+def resolve_variables(
+    obj, template_vars, template, destination, prompt, provided=(), answers=None
+):
+    """Merge the static, dynamic and prompted variables.
+
+    Args:
+        obj: Clinja's context object.
+        template_vars: Variables used by the template(s).
+        template: Template path provided to the dynamic source.
+        destination: Destination path provided to the dynamic source.
+        prompt: When to prompt for variable values.
+        provided: Variables provided by other means, never prompted for.
+        answers: Answers given in advance, their variables are never prompted
+            for.
+
+    Returns:
+        The variable names and values.
+    """
+    try:
+        all_vars = source_variables(obj, template_vars, template, destination)
+    except DYNAMIC_ERRORS as e:
+        err_exit(str(e))
+    answers = prompt_variables(all_vars, template_vars, prompt, provided, answers)
+    return {**all_vars, **answers}
+
+
+def report_writes(written, unchanged=None, up_to_date=None):
+    """Report the number of written, unchanged and up to date destinations."""
+    counts = [f"{written} written"]
+    if unchanged is not None:
+        counts.append(f"{unchanged} unchanged")
+    if up_to_date is not None:
+        counts.append(f"{up_to_date} up to date")
+    click.echo(", ".join(counts) + ".", err=True)
+
+
+def run_each(
+    obj,
+    template,
+    destination,
+    records,
+    prompt,
+    dry_run,
+    jobs,
+    cache,
+    buffer_size,
+    skip_unchanged=False,
+    manifest=None,
+    answers=None,
+    include_paths=(),
+):
+    """Render a template once per record, to the destination rendered with the
+    record's values."""
+    from .parallel import parallel_render_records
+    from .template import Template, get_environment
+
+    search_path = template_search_path(template, include_paths)
+    get_environment(search_path)
+    with click.open_file(str(template), "r") as fp:
+        contents = fp.read()
+    clinja_template = Template(StringIO(contents), cache=cache)
+    destination_template = Template(StringIO(str(destination)))
+
+    read_errors = []
+
+    def read(records_path):
+        # reading errors stop the rendering, the records read so far are kept
+        try:
+            yield from read_records(records_path)
+        except ValueError as e:
+            read_errors.append(f"{records_path}: {e}")
+
+    records = read(records)
+    first = next(records, None)
+    if first is None:
+        exit_on_errors(read_errors)
+        return
+    records = chain([first], records)
+
+    all_vars = resolve_variables(
+        obj,
+        clinja_template.get_vars() | destination_template.get_vars(),
+        io_path(template),
+        None,
+        prompt,
+        provided=first.keys(),
+        answers=answers,
+    )
+    if dry_run and destination != STDIO:
+        return
+
+    errors = {}
+    if destination == STDIO:
+        with click.open_file("-", "w") as fp:
+            for record in records:
+                clinja_template.dump({**all_vars, **record}, fp, buffer_size)
+        exit_on_errors(read_errors)
+        return
+
+    destinations = {}
+    # destination and manifest entry of the records to render
+    rendered = {}
+
+    def tasks():
+        for index, record in enumerate(records, 1):
+            record_vars = {**all_vars, **record}
+            try:
+                destination_path = Path(destination_template.render(record_vars))
+            except Exception as e:
+                errors[index] = f"Record {index}: {e}"
+                continue
+            if destination_path in destinations:
+                errors[index] = (
+                    f"Record {index}: {destination_path} already rendered by "
+                    f"record {destinations[destination_path]}."
+                )
+                continue
+            destinations[destination_path] = index
+            entry = None
+            if manifest is not None:
+                entry = manifest.entry(
+                    clinja_template.get_digest(),
+                    clinja_template.get_vars(),
+                    clinja_template.get_references(),
+                    record_vars,
+                    clinja_template.environment,
+                )
+                if manifest.is_fresh(destination_path, entry):
+                    continue
+            rendered[index] = (destination_path, entry)
+            yield index, record, destination_path
+
+    if jobs > 1:
+        render_errors, written = parallel_render_records(
+            contents,
+            tasks(),
+            all_vars,
+            jobs,
+            cache=cache,
+            buffer_size=buffer_size,
+            skip_unchanged=skip_unchanged,
+            search_path=search_path,
+        )
+        errors.update(render_errors)
+        unchanged = len(rendered) - len(render_errors) - written
+    else:
+        written = unchanged = 0
+        for index, record, destination_path in tasks():
+            try:
+                if clinja_template.dump_file(
+                    {**all_vars, **record},
+                    destination_path,
+                    buffer_size=buffer_size,
+                    skip_unchanged=skip_unchanged,
+                ):
+                    written += 1
+                else:
+                    unchanged += 1
+            except Exception as e:
+                errors[index] = f"Record {index}: {e}"
+    if manifest is not None:
+        for index, (destination_path, entry) in rendered.items():
+            if index not in errors:
+                manifest.set(destination_path, entry)
+        manifest.save()
+    if skip_unchanged or manifest is not None:
+        report_writes(
+            written,
+            unchanged if skip_unchanged else None,
+            len(destinations) - len(rendered) if manifest is not None else None,
+        )
+    exit_on_errors([errors[index] for index in sorted(errors)] + read_errors)
+
+
+def run_watch(
+    obj,
+    template,
+    destination,
+    prompt,
+    cache,
+    buffer_size,
+    skip_unchanged=False,
+    manifest=None,
+    profile=None,
+    answers=None,
+    include_paths=(),
+):
+    """Render the template(s), then re-render the destinations affected by each
+    change of the templates, the static file or the dynamic file, until
+    interrupted."""
+    from .template import Template, find_referenced_variables, get_environment
+    from .watch import Watcher
+
+    # the environment reloads the included templates which changed
+    get_environment(template_search_path(template, include_paths))
+
+    static = obj["static"]
+    dynamic = obj["dynamic"]
+    persist = manifest is not None
+    if manifest is None:
+        # only used to find the destinations affected by a change
+        manifest = Manifest(manifest_file=None)
+    # compiled templates, by path, with the modification time they were
+    # compiled at and the digests of the templates they reference
+    templates = {}
+    state = {"vars": None, "known": set(), "answers": None}
+
+    def source_paths():
+        paths = [static.static_file, dynamic.dynamic_file, *dynamic.depends]
+        return {Path(p).absolute() for p in paths}
+
+    def includes(clinja_template):
+        return find_referenced_variables(
+            get_environment(), clinja_template.get_references()
+        )[2]
+
+    def build(changed):
+        if template.is_dir():
+            pairs = [*walk_templates(template, destination)]
+        else:
+            pairs = [(template, destination)]
+        errors = []
+        clinja_templates = []
+        for template_path, destination_path in pairs:
+            try:
+                mtime = template_path.stat().st_mtime_ns
+                compiled = templates.get(template_path)
+                # the variables of the referenced templates are part of the
+                # template's variables
+                if (
+                    compiled is None
+                    or compiled[0] != mtime
+                    or compiled[2] != includes(compiled[1])
+                ):
+                    with open(template_path, "r") as fp:
+                        clinja_template = Template(fp, cache=cache)
+                    compiled = (mtime, clinja_template, includes(clinja_template))
+                    templates[template_path] = compiled
+                clinja_templates.append((compiled[1], destination_path))
+            except Exception as e:
+                templates.pop(template_path, None)
+                errors.append(f"{template_path}: {e}")
+        template_vars = set().union(*(t.get_vars() for t, _ in clinja_templates))
+
+        # the dynamic source only runs again if its inputs changed or new
+        # variables are needed
+        if (
+            state["vars"] is None
+            or changed & source_paths()
+            or not template_vars <= state["known"]
+        ):
+            static.reload()
+            try:
+                state["vars"] = source_variables(
+                    obj, template_vars, io_path(template), io_path(destination)
+                )
+            except DYNAMIC_ERRORS as e:
+                errors.append(str(e))
+                return errors
+            state["known"] = template_vars
+        all_vars = state["vars"]
+        if state["answers"] is None:
+            state["answers"] = prompt_variables(
+                all_vars, template_vars, prompt, answers=answers
+            )
+        all_vars = {**all_vars, **state["answers"]}
+        missing = template_vars - all_vars.keys()
+        if missing:
+            errors.append(f"Missing {', '.join(map(repr, sorted(missing)))}.")
+            return errors
+
+        manifest.forget_sources()
+        written = unchanged = up_to_date = 0
+        for clinja_template, destination_path in clinja_templates:
+            if destination_path == STDIO:
+                with click.open_file("-", "w") as fp:
+                    clinja_template.dump(all_vars, fp, buffer_size=buffer_size)
+                continue
+            entry = manifest.entry(
+                clinja_template.get_digest(),
+                clinja_template.get_vars(),
+                clinja_template.get_references(),
+                all_vars,
+                clinja_template.environment,
+            )
+            if manifest.is_fresh(destination_path, entry):
+                up_to_date += 1
+                continue
+            try:
+                if clinja_template.dump_file(
+                    all_vars,
+                    destination_path,
+                    buffer_size=buffer_size,
+                    skip_unchanged=skip_unchanged,
+                ):
+                    written += 1
+                else:
+                    unchanged += 1
+            except Exception as e:
+                errors.append(f"{destination_path}: {e}")
+                continue
+            manifest.set(destination_path, entry)
+        if persist:
+            manifest.save()
+        if destination != STDIO:
+            report_writes(
+                written, unchanged if skip_unchanged else None, up_to_date
+            )
+        return errors
+
+    template_paths = {
+        template.absolute(),
+        *(Path(p).absolute() for p in include_paths),
+    }
+    watched = {*template_paths, *source_paths()}
+    with Watcher(watched) as watcher:
+        changed = set()
+        try:
+            while True:
+                for error in build(changed):
+                    err_exit(error, exit_code=0)
+                if profile is not None:
+                    click.echo(profiling.report(profile), err=True)
+                    profiling.reset()
+                # the dynamic file's dependencies might have changed
+                if watched != {*template_paths, *source_paths()}:
+                    watched = {*template_paths, *source_paths()}
+                    watcher.set_paths(watched)
+                changed = watcher.wait()
+        except KeyboardInterrupt:
+            pass
+
 
 def prompt_value_check(value):
     try:
@@ -42,6 +564,57 @@ def prompt_variable_name_check(value):
 
 @click.group(cls=AliasedGroup, invoke_without_command=True)
 @click.pass_context
+@click.option(
+    "--dynamic-ttl",
+    "dynamic_ttl",
+    type=click.FloatRange(min=0),
+    default=None,
+    envvar="CLINJA_DYNAMIC_TTL",
+    help="Cache the dynamic variables for this many seconds.",
+)
+@click.option(
+    "--provider-timeout",
+    "provider_timeout",
+    type=click.FloatRange(min=0),
+    default=None,
+    envvar="CLINJA_PROVIDER_TIMEOUT",
+    help="Timeout of each dynamic variable provider, in seconds.",
+)
+@click.option(
+    "--sandbox",
+    "sandbox",
+    is_flag=True,
+    default=False,
+    envvar="CLINJA_SANDBOX",
+    help=(
+        "Run the dynamic file in a separate worker process, implied by the "
+        "limits below."
+    ),
+)
+@click.option(
+    "--dynamic-timeout",
+    "dynamic_timeout",
+    type=click.FloatRange(min=0),
+    default=None,
+    envvar="CLINJA_DYNAMIC_TIMEOUT",
+    help="Timeout of the sandboxed dynamic file, in seconds.",
+)
+@click.option(
+    "--dynamic-memory",
+    "dynamic_memory",
+    type=click.IntRange(min=1),
+    default=None,
+    envvar="CLINJA_DYNAMIC_MEMORY",
+    help="Memory limit of the sandboxed dynamic file, in MB.",
+)
+@click.option(
+    "--dynamic-cpu",
+    "dynamic_cpu",
+    type=click.FloatRange(min=0),
+    default=None,
+    envvar="CLINJA_DYNAMIC_CPU",
+    help="CPU time limit of the sandboxed dynamic file, in seconds.",
+)
 @f_docstring(
     f"""
 A versatile jinja command line interface.
@@ -59,7 +632,15 @@ In short:
     Clinja's {bold('dynamic')} variables are computed by the python file: {bold(str(DYNAMIC_FILE))}
 """
 )
-def cli(ctx):  # pragma: no cover
+def cli(
+    ctx,
+    dynamic_ttl=None,
+    provider_timeout=None,
+    sandbox=False,
+    dynamic_timeout=None,
+    dynamic_memory=None,
+    dynamic_cpu=None,
+):  # pragma: no cover
     ctx.ensure_object(dict)
 
     if not CONF_DIR.is_dir():
@@ -67,19 +648,46 @@ def cli(ctx):  # pragma: no cover
     if not DYNAMIC_FILE.is_file():
         with open(DYNAMIC_FILE, "w") as fp:
             fp.write(DYNAMIC_FILE_INIT)
-    if not STATIC_FILE.is_file():
-        with open(STATIC_FILE, "w") as fp:
+    static_file = get_static_file()
+    if not static_file.is_file():
+        with open(static_file, "w") as fp:
             fp.write(STATIC_FILE_INIT)
-    ctx.obj["static"] = ClinjaStatic(static_file=STATIC_FILE)
-    ctx.obj["dynamic"] = ClinjaDynamic(dynamic_file=DYNAMIC_FILE)
+    ctx.obj["static"] = ClinjaStatic(static_file=static_file)
+    worker = None
+    limits = [dynamic_timeout, dynamic_memory, dynamic_cpu]
+    if sandbox or any(limit is not None for limit in limits):
+        from .sandbox import DynamicWorker
+
+        worker = DynamicWorker(
+            timeout=dynamic_timeout,
+            memory_limit=None if dynamic_memory is None else dynamic_memory * 1024**2,
+            cpu_limit=dynamic_cpu,
+        )
+    ctx.obj["dynamic"] = ClinjaDynamic(
+        dynamic_file=DYNAMIC_FILE,
+        cache_ttl=dynamic_ttl,
+        cache_dir=DYNAMIC_CACHE_DIR,
+        provider_timeout=provider_timeout,
+        code_cache_dir=DYNAMIC_CODE_CACHE_DIR,
+        worker=worker,
+    )
+    ctx.obj["template_cache"] = TemplateCache(cache_dir=TEMPLATE_CACHE_DIR)
+    ctx.obj["manifest"] = Manifest(manifest_file=MANIFEST_FILE)
+    ctx.obj["client"] = ClinjaClient(socket_file=SOCKET_FILE)
     # if no subcommand is provided default to run.
     if ctx.invoked_subcommand is None:
         ctx.invoke(run)
 
 
 @cli.command(name="run")
-@click.argument("template", default="-", type=click.File("r"))
-@click.argument("destination", default="-", type=click.File("w"))
+@click.argument(
+    "template",
+    default="-",
+    type=click.Path(exists=True, allow_dash=True, path_type=Path),
+)
+@click.argument(
+    "destination", default="-", type=click.Path(allow_dash=True, path_type=Path)
+)
 @click.option(
     "--prompt",
     "prompt",
@@ -87,6 +695,16 @@ def cli(ctx):  # pragma: no cover
     default="always",
     help="When to prompt for variable values.",
 )
+@click.option(
+    "--answers",
+    "answers_file",
+    type=click.Path(allow_dash=True, dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        "Answer the prompts from a json, yaml or .env file, json when reading "
+        "stdin."
+    ),
+)
 @click.option(
     "-d",
     "--dry-run",
@@ -95,46 +713,413 @@ def cli(ctx):  # pragma: no cover
     default=False,
     help=("Dry run, won't write any files or change/add any static" " values."),
 )
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to render a template directory or records.",
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    default=False,
+    envvar="CLINJA_CACHE",
+    help="Use the on disk compiled template cache.",
+)
+@click.option(
+    "-b",
+    "--buffer-size",
+    "buffer_size",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of rendered chunks to buffer before each write.",
+)
+@click.option(
+    "-I",
+    "--include-path",
+    "include_paths",
+    type=click.Path(file_okay=False, path_type=Path),
+    multiple=True,
+    envvar="CLINJA_INCLUDE_PATH",
+    help=(
+        "Directory in which included and imported templates are looked up, "
+        "after the template's directory. Can be repeated."
+    ),
+)
+@click.option(
+    "--each",
+    "records",
+    type=click.Path(allow_dash=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Render the template once per record of a JSONL or CSV file.",
+)
+@click.option(
+    "--skip-unchanged",
+    "skip_unchanged",
+    is_flag=True,
+    default=False,
+    envvar="CLINJA_SKIP_UNCHANGED",
+    help="Don't rewrite destinations whose contents wouldn't change.",
+)
+@click.option(
+    "--incremental",
+    "incremental",
+    is_flag=True,
+    default=False,
+    envvar="CLINJA_INCREMENTAL",
+    help="Only render the destinations whose inputs changed since the last run.",
+)
+@click.option(
+    "-w",
+    "--watch",
+    "watch",
+    is_flag=True,
+    default=False,
+    help="Re-render the affected destinations on each change, until interrupted.",
+)
+@click.option(
+    "--profile",
+    "profile",
+    is_flag=True,
+    envvar="CLINJA_PROFILE",
+    help="Report the time spent in each phase of the run on stderr.",
+)
+@click.option(
+    "--profile-format",
+    "profile_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    envvar="CLINJA_PROFILE_FORMAT",
+    help="Format of the --profile report.",
+)
+@click.option(
+    "--profile-dynamic",
+    "profile_dynamic",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    envvar="CLINJA_PROFILE_DYNAMIC",
+    help="Dump the cProfile stats of the dynamic source's execution to a file.",
+)
 @click.pass_obj
 def run(
     obj,
     template,
     destination,
     prompt="always",
+    answers_file=None,
     dry_run=False,
+    jobs=1,
+    use_cache=False,
+    buffer_size=1,
+    include_paths=(),
+    records=None,
+    skip_unchanged=False,
+    incremental=False,
+    watch=False,
+    profile=False,
+    profile_format="text",
+    profile_dynamic=None,
 ):
     """Run jinja on a template.
 
     TEMPLATE (optional, default: stdin): template file on which to run jinja.
+    If TEMPLATE is a directory, every file in it is rendered to the same
+    relative path in DESTINATION.
 
-    DESTINATION (optional, default: stdout): output destination.
+    DESTINATION (optional, default: stdout): output destination, must be a
+    directory when TEMPLATE is a directory. With --each, DESTINATION is a
+    template of the output path, rendered with each record's values.
     """
-    clinja_template = Template(template)
-    static = obj["static"]
-    static_vars = static.stored
-    dynamic_vars = obj["dynamic"].run(
-        static_vars=static_vars, template=template, destination=destination
+    # format of the report, None when not profiling
+    profile = profile_format if profile else None
+    if profile is not None or profile_dynamic is not None:
+        profiling.enable(dynamic_stats_file=profile_dynamic)
+    if profile is not None:
+        # report even if the run fails
+        click.get_current_context().call_on_close(
+            lambda: click.echo(profiling.report(profile), err=True)
+        )
+
+    answers = None
+    if answers_file is not None:
+        if answers_file == STDIO and STDIO in (template, records):
+            raise click.UsageError("--answers can't be stdin when TEMPLATE or --each is.")
+        answers = read_answers(answers_file)
+
+    manifest = obj["manifest"] if incremental else None
+    compiled = is_compiled(template)
+    if watch:
+        if compiled:
+            raise click.UsageError("--watch can't be used with compiled templates.")
+        if template == STDIO:
+            raise click.UsageError("TEMPLATE must be a file or directory with --watch.")
+        if records is not None:
+            raise click.UsageError("--watch can't be used with --each.")
+        if dry_run:
+            raise click.UsageError("--watch can't be used with --dry-run.")
+        template_cache = obj["template_cache"] if use_cache else None
+        run_watch(
+            obj,
+            template,
+            destination,
+            prompt,
+            template_cache,
+            buffer_size,
+            skip_unchanged=skip_unchanged,
+            manifest=manifest,
+            profile=profile,
+            answers=answers,
+            include_paths=include_paths,
+        )
+        return
+
+    if records is not None:
+        if template.is_dir() or compiled:
+            raise click.UsageError("TEMPLATE can't be a directory with --each.")
+        if template == STDIO and records == STDIO:
+            raise click.UsageError("TEMPLATE and --each can't both be stdin.")
+        template_cache = obj["template_cache"] if use_cache else None
+        run_each(
+            obj,
+            template,
+            destination,
+            records,
+            prompt,
+            dry_run,
+            jobs,
+            template_cache,
+            buffer_size,
+            skip_unchanged=skip_unchanged,
+            manifest=manifest,
+            answers=answers,
+            include_paths=include_paths,
+        )
+        return
+
+    client = obj.get("client")
+    if (
+        not template.is_dir()
+        and not compiled
+        and not incremental
+        # the daemon renders with its own options, run locally when they matter
+        and profile_dynamic is None
+        and not use_cache
+        and buffer_size == 1
+        and default_dynamic(obj)
+        and client is not None
+        and client.connect()
+    ):
+        # the daemon does the rendering, don't import jinja
+        with client, profiling.phase("daemon"):
+            run_client(
+                client,
+                template,
+                destination,
+                prompt,
+                dry_run,
+                skip_unchanged=skip_unchanged,
+                answers=answers,
+                include_paths=include_paths,
+            )
+        return
+
+    if (template.is_dir() or compiled) and destination == STDIO:
+        raise click.UsageError(
+            "DESTINATION must be a directory when TEMPLATE is a directory."
+        )
+
+    with profiling.phase("import"):
+        from .parallel import parallel_parse, parallel_render, template_pool
+        from .template import CompiledTemplates, Template, get_environment
+
+    if compiled:
+        try:
+            compiled_templates = CompiledTemplates(template)
+        except ValueError as e:
+            err_exit(str(e))
+        names = compiled_templates.names()
+        pairs = [(name, destination / name) for name in names]
+    elif template.is_dir():
+        pairs = [*walk_templates(template, destination)]
+    else:
+        pairs = [(template, destination)]
+
+    search_path = template_search_path(template, include_paths)
+    get_environment(search_path)
+    template_cache = obj["template_cache"] if use_cache else None
+    parallel = jobs > 1 and len(pairs) > 1
+    if parallel:
+        # the same workers parse, then render the templates
+        pool = click.get_current_context().with_resource(
+            template_pool(
+                jobs,
+                cache=template_cache,
+                buffer_size=buffer_size,
+                skip_unchanged=skip_unchanged,
+                search_path=search_path,
+                compiled=template if compiled else None,
+            )
+        )
+    # digests of the referenced templates, only known beforehand for compiled
+    # templates
+    includes = [None] * len(pairs)
+    # compiled code of the templates parsed by the workers
+    codes = [None] * len(pairs)
+    if compiled:
+        # no parsing, the compiled templates describe themselves
+        compiled_infos = [compiled_templates.infos[name] for name in names]
+        infos = [
+            (set(info["variables"]), info["references"], info["digest"])
+            for info in compiled_infos
+        ]
+        includes = [info["includes"] for info in compiled_infos]
+        if not parallel:
+            clinja_templates = [
+                (Template.from_compiled(compiled_templates, name), destination_path)
+                for name, destination_path in pairs
+            ]
+        template_vars = set().union(*(variables for variables, _, _ in infos))
+    elif parallel:
+        # the workers parse and compile, only their wall time is known
+        with profiling.phase("parse"):
+            infos, errors, codes = parallel_parse([t for t, _ in pairs], pool)
+        exit_on_errors(errors)
+        template_vars = set().union(*(variables for variables, _, _ in infos))
+    else:
+        errors = []
+        clinja_templates = []
+        for template_path, destination_path in pairs:
+            try:
+                with click.open_file(str(template_path), "r") as fp:
+                    clinja_templates.append(
+                        (Template(fp, cache=template_cache), destination_path)
+                    )
+            except Exception as e:
+                errors.append(f"{template_path}: {e}")
+        exit_on_errors(errors)
+        template_vars = set().union(*(t.get_vars() for t, _ in clinja_templates))
+        infos = [
+            (t.get_vars(), t.get_references(), t.get_digest())
+            for t, _ in clinja_templates
+        ]
+
+    # in directory mode, the dynamic source is run once for the whole tree
+    all_vars = resolve_variables(
+        obj,
+        template_vars,
+        io_path(template),
+        io_path(destination),
+        prompt,
+        answers=answers,
     )
-    all_vars = {**static_vars, **dynamic_vars}
-
-    prompt_vars = clinja_template.get_vars()
-    if prompt == "missing" or prompt == "never":
-        prompt_vars = prompt_vars - (set(dynamic_vars.keys()) | set(static_vars.keys()))
-        if prompt == "never" and len(prompt_vars) > 0:
-            # only continue if there are no missing vars
-            err_exit(f"Missing {', '.join(map(repr, prompt_vars))}.")
-
-    for var in sorted(prompt_vars):
-        value = prompt_tty(
-            bold(var),
-            default=all_vars.get(var, None),
-            value_proc=prompt_value_check,
-            show_default=True,
+    if dry_run and destination != STDIO:
+        return
+
+    # manifest entries of the destinations to render
+    entries = {}
+    if manifest is not None and destination != STDIO:
+        with profiling.phase("manifest"):
+            for (_, destination_path), info, included in zip(pairs, infos, includes):
+                variables, references, digest = info
+                entry = manifest.entry(
+                    digest,
+                    variables,
+                    references,
+                    all_vars,
+                    None if compiled else get_environment(),
+                    includes=included,
+                )
+                if not manifest.is_fresh(destination_path, entry):
+                    entries[destination_path] = entry
+        stale = [i for i, (_, d) in enumerate(pairs) if d in entries]
+        pairs = [pairs[i] for i in stale]
+        codes = [codes[i] for i in stale]
+        if not parallel:
+            clinja_templates = [clinja_templates[i] for i in stale]
+    up_to_date = len(infos) - len(pairs)
+
+    if parallel:
+        # the workers render and write, only their wall time is known
+        with profiling.phase("render"):
+            errors, written = parallel_render(pairs, all_vars, pool, codes)
+        unchanged = len(pairs) - len(errors) - written
+        failed = {d for t, d in pairs if t in errors}
+        errors = [*errors.values()]
+    else:
+        errors = []
+        failed = set()
+        written = unchanged = 0
+        for (template_path, destination_path), (clinja_template, _) in zip(
+            pairs, clinja_templates
+        ):
+            try:
+                if destination_path == STDIO:
+                    with click.open_file("-", "w") as fp:
+                        clinja_template.dump(all_vars, fp, buffer_size=buffer_size)
+                elif clinja_template.dump_file(
+                    all_vars,
+                    destination_path,
+                    buffer_size=buffer_size,
+                    skip_unchanged=skip_unchanged,
+                ):
+                    written += 1
+                else:
+                    unchanged += 1
+            except Exception as e:
+                errors.append(f"{template_path}: {e}")
+                failed.add(destination_path)
+
+    if manifest is not None and destination != STDIO:
+        with profiling.phase("manifest"):
+            for destination_path, entry in entries.items():
+                if destination_path not in failed:
+                    manifest.set(destination_path, entry)
+            manifest.save()
+    if (skip_unchanged or manifest is not None) and destination != STDIO:
+        report_writes(
+            written,
+            unchanged if skip_unchanged else None,
+            up_to_date if manifest is not None else None,
         )
-        all_vars[var] = value
+    exit_on_errors(errors)
+
+
+@cli.command(name="compile")
+@click.argument(
+    "template_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.argument("out", type=click.Path(path_type=Path))
+@click.option(
+    "--zip",
+    "use_zip",
+    is_flag=True,
+    default=False,
+    help="Write the compiled templates to a zip file.",
+)
+def compile_(template_dir, out, use_zip=False):
+    """Compile templates ahead of time, to python modules.
+
+    TEMPLATE_DIR: directory of templates to compile.
+
+    OUT: directory, or zip file with --zip, to write the compiled templates to.
+    Use it as TEMPLATE in clinja run to render every template without parsing
+    or compiling them.
+    """
+    from jinja2 import TemplateSyntaxError
+
+    from .template import compile_templates
 
-    if not dry_run or destination.name == "<stdout>":
-        destination.write(clinja_template.render(all_vars))
+    try:
+        count = compile_templates(template_dir, out, zip=use_zip)
+    except TemplateSyntaxError as e:
+        err_exit(f"{e.name}:{e.lineno}: {e.message}")
+    except (OSError, UnicodeDecodeError) as e:
+        err_exit(str(e))
+    click.echo(f"Compiled {bold(str(count))} template(s).")
 
 
 @cli.command(name="list")
@@ -145,7 +1130,16 @@ def list(obj, pattern=None):
 
     PATTERN (optional): regexp pattern for variable name filtering.
     """
-    for k, v in obj["static"].list(pattern=pattern):
+    client = obj.get("client")
+    if client is not None and client.connect():
+        with client:
+            response = client.request("list", pattern=pattern)
+        if "error" in response:
+            err_exit(response["error"])
+        items = response["items"]
+    else:
+        items = obj["static"].list(pattern=pattern)
+    for k, v in items:
         click.echo(f"{bold(k)}: {v}")
 
 
@@ -159,15 +1153,10 @@ def list(obj, pattern=None):
 @click.pass_obj
 def remove(obj, variable_name):
     """Remove stored static variable(s)."""
-    static = obj["static"]
-    err = False
-    for v_name in variable_name:
-        try:
-            static.remove(v_name)
-        except KeyError as e:
-            err = True
-            err_exit(f"Variable name {e} is not in storage.", exit_code=0)
-    if err:
+    missing = obj["static"].remove_many(variable_name)
+    for v_name in missing:
+        err_exit(f"Variable name '{v_name}' is not in storage.", exit_code=0)
+    if missing:
         sys.exit(1)
 
 
@@ -183,7 +1172,6 @@ def remove(obj, variable_name):
 @click.pass_obj
 def add(obj, variable_name: str = "", value: Any = (), force: bool = False):
     """Add a variable to static storage."""
-    static = obj["static"]
     if variable_name == "":
         variable_name = click.prompt(
             bold("variable name"), value_proc=prompt_variable_name_check
@@ -196,22 +1184,105 @@ def add(obj, variable_name: str = "", value: Any = (), force: bool = False):
         # check for when this is called outside of command line
         value = literal_eval_or_string(value)
 
-    try:
-        static.add(variable_name, value, force=force)
-    except ValueError:
-        msg = "".join(
+    def overwrite_msg(current):
+        return "".join(
             [
                 "Do you want to overwrite ",
-                bold(str(static.stored[variable_name])),
+                bold(str(current)),
                 " with ",
                 bold(str(value)),
                 "?",
             ]
         )
-        if click.confirm(msg, default=True):
+
+    client = obj.get("client")
+    if client is not None and client.connect():
+        with client:
+            response = client.request(
+                "add", variable_name=variable_name, value=value, force=force
+            )
+        # the connection is closed while confirming, not to hold the daemon
+        if "current" in response and click.confirm(
+            overwrite_msg(response["current"]), default=True
+        ):
+            if not client.connect():
+                err_exit("The clinja daemon stopped.")
+            with client:
+                response = client.request(
+                    "add", variable_name=variable_name, value=value, force=True
+                )
+        if "error" in response:
+            err_exit(response["error"])
+        return
+
+    static = obj["static"]
+    try:
+        static.add(variable_name, value, force=force)
+    except ValueError:
+        if click.confirm(overwrite_msg(static.stored[variable_name]), default=True):
             static.add(variable_name, value, force=True)
 
 
+@cli.command(name="migrate")
+@click.argument(
+    "destination", default=STATIC_DB_FILE, type=click.Path(path_type=Path)
+)
+@click.pass_obj
+def migrate(obj, destination=STATIC_DB_FILE):
+    """Migrate the static variables to another static file.
+
+    DESTINATION (optional, default: static.db in the config directory): new
+    static file, ".db", ".sqlite" and ".sqlite3" files are SQLite databases,
+    other files are json files. Clinja uses the default SQLite static file
+    when it exists.
+    """
+    if destination.exists():
+        err_exit(f'"{destination}" already exists.')
+    if destination.suffix not in SQLITE_SUFFIXES:
+        destination.write_text(STATIC_FILE_INIT)
+    migrated = obj["static"].migrate(destination)
+    click.echo(
+        f"Migrated {bold(str(len(migrated.storage.keys())))} variable(s) to "
+        f"{bold(str(destination))}."
+    )
+
+
+@cli.command(name="import")
+@click.argument("file", default="-", type=click.File("r"))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["json", "yaml", "env"]),
+    default=None,
+    help=(
+        "Format of FILE, guessed from its extension by default, json when "
+        "reading stdin."
+    ),
+)
+@click.option("-f", "--force", "force", is_flag=True, default=False)
+@click.pass_obj
+def import_(obj, file, fmt=None, force=False):
+    """Import static variables from a file, in a single write.
+
+    FILE (optional, default: stdin): json, yaml or .env file of variable names
+    and values.
+    """
+    if fmt is None:
+        fmt = guess_format(Path(file.name))
+    try:
+        values = load_variables(file, fmt=fmt)
+    except ImportError:
+        err_exit("Importing yaml files requires PyYAML, pip install pyyaml.")
+    except ValueError as e:
+        err_exit(f"Could not read {file.name}: {e}")
+
+    try:
+        obj["static"].update(values, force=force)
+    except ValueError as e:
+        err_exit(f"{e} Use --force to overwrite.")
+    click.echo(f"Imported {bold(str(len(values)))} variable(s).")
+
+
 @cli.command(name="test")
 @click.option("--template", type=Path, help="mock template path.")
 @click.option("--destination", type=Path, help="mock template path.")
@@ -240,16 +1311,82 @@ def test(obj, template=None, destination=None, run_cwd=Path.cwd(), static_vars=N
             err_exit(f'"{static_vars}" is not valid json, {e}')
     else:
         static_vars = obj["static"].stored
-    dynamic_vars = obj["dynamic"].run(
-        static_vars=static_vars,
-        template=template,
-        destination=destination,
-        run_cwd=run_cwd,
-    )
+    try:
+        dynamic_vars = obj["dynamic"].run(
+            static_vars=static_vars,
+            template=template,
+            destination=destination,
+            run_cwd=run_cwd,
+        )
+    except DYNAMIC_ERRORS as e:
+        err_exit(str(e))
+    if obj["dynamic"].from_cache:
+        click.echo("Dynamic variables loaded from cache.", err=True)
     for k, v in sorted(dynamic_vars.items()):
         click.echo(f"{bold(k)}: {v}")
 
 
+@cli.command(name="serve")
+@click.option(
+    "--socket",
+    "socket_file",
+    default=SOCKET_FILE,
+    type=click.Path(path_type=Path),
+    help="Path of the unix socket.",
+)
+@click.pass_obj
+def serve(obj, socket_file=SOCKET_FILE):
+    """Run the clinja daemon.
+
+    The daemon keeps the static values and the compiled templates in memory.
+    While it runs, the run, list and add commands are forwarded to it.
+    """
+    try:
+        from .server import ClinjaServer
+    except AttributeError:
+        err_exit("The clinja daemon requires unix socket support.")
+    server = ClinjaServer(obj, socket_file=socket_file)
+    worker = obj["dynamic"].worker
+    if worker is not None:
+        # fork the worker before the first request
+        worker.start()
+    click.echo(f"Listening on {bold(str(socket_file))}.", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if worker is not None:
+            worker.close()
+
+
+@cli.group(name="cache", cls=AliasedGroup)
+def cache():
+    """Manage the compiled template and dynamic variable caches."""
+
+
+@cache.command(name="clear")
+@click.pass_obj
+def cache_clear(obj):
+    """Remove all compiled templates, dynamic variables and incremental
+    manifest entries from the caches."""
+    removed = obj["template_cache"].clear()
+    click.echo(f"Removed {bold(str(removed))} compiled template(s).")
+    removed = obj["dynamic"].clear_cache()
+    click.echo(f"Removed {bold(str(removed))} cached dynamic result(s).")
+    removed = obj["manifest"].clear()
+    click.echo(f"Removed {bold(str(removed))} incremental build record(s).")
+
+
+@cache.command(name="stats")
+@click.pass_obj
+def cache_stats(obj):
+    """Show compiled template cache statistics."""
+    for k, v in obj["template_cache"].stats().items():
+        click.echo(f"{bold(k)}: {v}")
+
+
 @cli.command(name="completion")
 @click.argument("shell", type=click.Choice(["bash", "zsh", "fish"]))
 @click.pass_context
@@ -0,0 +1,66 @@
+import json
+import socket
+from pathlib import Path
+
+from .settings import SOCKET_FILE
+
+
+class ClinjaClient:
+    def __init__(self, socket_file: Path = SOCKET_FILE):
+        """Forwards requests to a running clinja daemon.
+
+        Args:
+            socket_file: Path of the daemon's unix socket.
+        """
+        self.socket_file = socket_file
+        self._fp = None
+
+    def connect(self) -> bool:
+        """Connect to the daemon.
+
+        Returns:
+            True if connected, False if no daemon is running.
+        """
+        if not hasattr(socket, "AF_UNIX") or not self.socket_file.is_socket():
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.socket_file))
+        except OSError:
+            sock.close()
+            return False
+        self._fp = sock.makefile("rw", encoding="utf8")
+        # the file object keeps its own reference to the socket
+        sock.close()
+        return True
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, command: str, **kwargs) -> dict:
+        """Send a request to the daemon.
+
+        Args:
+            command: Command to run.
+            **kwargs: Arguments of the command.
+
+        Returns:
+            The daemon's response.
+
+        Raises:
+            ConnectionError: if the daemon closed the connection.
+        """
+        self._fp.write(json.dumps({"command": command, **kwargs}, default=str) + "\n")
+        self._fp.flush()
+        line = self._fp.readline()
+        if not line:
+            raise ConnectionError("The clinja daemon closed the connection.")
+        return json.loads(line)
@@ -1,78 +1,427 @@
 import json
-import re
+import os
+import pickle
+import time
+from hashlib import sha256
 from io import TextIOWrapper
 from pathlib import Path
-from typing import Any, Union
+from threading import Thread
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
 
-import click
-from myopy import PyFile
-
-from .settings import DYNAMIC_FILE, STATIC_FILE
+from .settings import DYNAMIC_CACHE_DIR, DYNAMIC_FILE, STATIC_FILE
+from .storage import open_storage
 from .utils import sanitize_variable_name
 
 
 class ClinjaDynamic:
-    def __init__(self, dynamic_file: Path = DYNAMIC_FILE):
+    def __init__(
+        self,
+        dynamic_file: Path = DYNAMIC_FILE,
+        cache_ttl: Optional[float] = None,
+        cache_dir: Path = DYNAMIC_CACHE_DIR,
+        provider_timeout: Optional[float] = None,
+        code_cache_dir: Optional[Path] = None,
+        memoize: bool = True,
+        worker: Optional["DynamicWorker"] = None,
+    ):
         """This class handles clinja's dynamic.py file.
 
         Args:
             dynamic_file: Path to the dynamic file.
+            cache_ttl: Time to live of the cached results, in seconds. If None,
+                the results are not cached.
+            cache_dir: Directory in which to cache the results.
+            provider_timeout: Timeout of each variable provider, in seconds. If
+                None, the providers can run indefinitely.
+            code_cache_dir: Directory in which to persist the dynamic file's
+                compiled code. If None, the code is compiled once per process.
+            memoize: Keep the results in memory and reuse them while the inputs,
+                the dynamic file and its dependencies are unchanged, and the
+                cache_ttl, if any, hasn't expired.
+            worker: Worker process in which to run the dynamic file. If None,
+                the dynamic file runs in this process.
+
+        Attributes:
+            from_cache: Whether the results of the last run came from the cache,
+                in memory or on disk.
+            depends: Paths of the files on which the results of the last run
+                depend, from DYNAMIC_DEPENDS.
         """
         self.dynamic_file = dynamic_file
+        self.cache_ttl = cache_ttl
+        self.cache_dir = cache_dir
+        self.provider_timeout = provider_timeout
+        self.code_cache_dir = code_cache_dir
+        self.memoize = memoize
+        self.worker = worker
+        self.from_cache = False
+        self.depends = []
+        # results of the previous runs, by inputs
+        self._memo = {}
 
     @staticmethod
-    def _get_io_path(textio: TextIOWrapper) -> Path:
+    def _get_io_path(textio: TextIOWrapper) -> Optional[Path]:
         """Tries to find the file path of a TextIOWrapper object.
 
         Args:
             textio: TextIOWrapper instance for which to find the path.
 
         Returns:
-            path to textio's file.
+            path to textio's file, None for stdin and stdout.
         """
         if not hasattr(textio, "name") or textio.name in ["<stdin>", "<stdout>"]:
             return None
         else:
             return Path(textio.name)
 
+    @staticmethod
+    def _file_states(paths: list) -> dict:
+        """Get the modification time and size of files.
+
+        Args:
+            paths: File paths.
+
+        Returns:
+            Mapping of the file paths to their state, None for missing files.
+        """
+        states = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                states[str(path)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                states[str(path)] = None
+        return states
+
+    def _cache_path(self, **inputs) -> Path:
+        """Path of the cached results for a set of inputs.
+
+        Args:
+            **inputs: The variables provided to the dynamic file.
+
+        Returns:
+            Path of the cache entry.
+        """
+        key = sha256(self.dynamic_file.read_bytes())
+        key.update(json.dumps(inputs, sort_keys=True, default=str).encode("utf8"))
+        return self.cache_dir / key.hexdigest()
+
+    def _cache_load(self, cache_path: Path) -> Optional[Tuple[dict, list]]:
+        """Load cached results, if they are still valid.
+
+        Args:
+            cache_path: Path of the cache entry.
+
+        Returns:
+            The cached dynamic variables and the paths on which they depend, None
+            if missing or invalid.
+        """
+        try:
+            with open(cache_path, "rb") as fp:
+                entry = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if time.time() - entry["time"] > self.cache_ttl:
+            return None
+        if self._file_states(entry["depends"]) != entry["depends"]:
+            return None
+        return entry["vars"], [*entry["depends"]]
+
+    def _cache_dump(self, cache_path: Path, dynamic_vars: dict, depends: list):
+        """Cache results, results which can't be pickled are not cached.
+
+        Args:
+            cache_path: Path of the cache entry.
+            dynamic_vars: Dynamic variables to cache.
+            depends: Paths of the files on which the results depend.
+        """
+        entry = {
+            "time": time.time(),
+            "depends": self._file_states(depends),
+            "vars": dynamic_vars,
+        }
+        try:
+            data = pickle.dumps(entry)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, cache_path)
+
+    def _memo_load(self, key: str) -> Optional[Tuple[dict, list]]:
+        """Get the results of a previous run, if they are still valid.
+
+        Args:
+            key: Inputs of the run.
+
+        Returns:
+            The dynamic variables and the paths on which they depend, None if
+            missing or invalid.
+        """
+        entry = self._memo.get(key)
+        if entry is None:
+            return None
+        run_time, dynamic_vars, states = entry
+        if self.cache_ttl is not None and time.time() - run_time > self.cache_ttl:
+            return None
+        if self._file_states(states) != states:
+            return None
+        depends = [p for p in states if p != str(self.dynamic_file)]
+        return dynamic_vars.copy(), depends
+
+    def forget(self):
+        """Discard the results kept in memory, the next run executes the dynamic
+        file again, unless its results are cached on disk.
+        """
+        self._memo = {}
+
+    def clear_cache(self) -> int:
+        """Remove all the cached results, and the persisted compiled code of the
+        dynamic file.
+
+        Returns:
+            The number of removed results.
+        """
+        self.forget()
+        if self.code_cache_dir is not None and self.code_cache_dir.is_dir():
+            for path in self.code_cache_dir.iterdir():
+                if path.is_file():
+                    path.unlink()
+        if not self.cache_dir.is_dir():
+            return 0
+        entries = [p for p in self.cache_dir.iterdir() if p.is_file()]
+        for path in entries:
+            path.unlink()
+        return len(entries)
+
+    @staticmethod
+    def _call_in_thread(loop, provider: Callable) -> "asyncio.Future":
+        """Call a provider in a daemon thread, a provider which times out does
+        not prevent clinja from exiting.
+
+        Args:
+            loop: Event loop on which to resolve the future.
+            provider: Provider to call.
+
+        Returns:
+            Future of the provider's value.
+        """
+        future = loop.create_future()
+
+        def resolve(method, value):
+            if not future.done():
+                method(value)
+
+        def target():
+            try:
+                result = (future.set_result, provider())
+            except BaseException as e:
+                result = (future.set_exception, e)
+            try:
+                loop.call_soon_threadsafe(resolve, *result)
+            except RuntimeError:
+                # the loop is closed, the provider timed out
+                pass
+
+        Thread(target=target, daemon=True).start()
+        return future
+
+    async def _run_provider(self, name: str, provider: Callable) -> Any:
+        """Run a provider, coroutine functions are awaited, other callables are
+        called in a thread.
+
+        Args:
+            name: Name of the provided variable.
+            provider: Provider to run.
+
+        Returns:
+            The provided value.
+
+        Raises:
+            TimeoutError: if the provider takes longer than `self.provider_timeout`.
+        """
+        import asyncio
+
+        if asyncio.iscoroutinefunction(provider):
+            awaitable = provider()
+        else:
+            awaitable = self._call_in_thread(asyncio.get_event_loop(), provider)
+        try:
+            return await asyncio.wait_for(awaitable, self.provider_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f'Provider of "{name}" timed out after {self.provider_timeout}s.'
+            )
+
+    async def _gather_providers(self, providers: dict) -> list:
+        import asyncio
+
+        tasks = [
+            asyncio.ensure_future(self._run_provider(name, provider))
+            for name, provider in providers.items()
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # the loop is closed afterwards, don't leave the other providers
+            # pending
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _run_providers(self, providers: dict) -> dict:
+        """Concurrently run the variable providers registered by the dynamic file.
+
+        The providers are run in the same conditions as the dynamic file
+        itself, i.e. from the dynamic file's directory.
+
+        Args:
+            providers: Mapping of variable names to providers.
+
+        Returns:
+            Mapping of the variable names to the provided values.
+
+        Raises:
+            TimeoutError: if a provider takes longer than `self.provider_timeout`.
+        """
+        import asyncio
+
+        from myopy.utils import saved_sys_properties
+
+        if not providers:
+            return {}
+        loop = asyncio.new_event_loop()
+        try:
+            with saved_sys_properties():
+                os.chdir(self.dynamic_file.parent.resolve())
+                values = loop.run_until_complete(self._gather_providers(providers))
+        finally:
+            loop.close()
+        return dict(zip(providers.keys(), values))
+
+    def execute(
+        self, inputs: dict, variables: Optional[set] = None
+    ) -> Tuple[dict, list, list]:
+        """Run the dynamic file and the providers of the needed variables, in
+        this process.
+
+        Args:
+            inputs: The variables provided to the dynamic file.
+            variables: Names of the variables needed, only the providers of these
+                variables are called. If None, all the providers are called.
+
+        Returns:
+            The dynamic variables, the DYNAMIC_DEPENDS paths, absolute, and the
+            DYNAMIC_VOLATILE names populated by the dynamic file.
+        """
+        from .pyfile import CachedPyFile
+
+        dynamic_vars = {}
+        dynamic_depends = []
+        dynamic_providers = {}
+        dynamic_volatile = []
+        conf = CachedPyFile(self.dynamic_file, code_cache_dir=self.code_cache_dir)
+        conf.provide(
+            **inputs,
+            DYNAMIC_VARS=dynamic_vars,
+            DYNAMIC_DEPENDS=dynamic_depends,
+            DYNAMIC_PROVIDERS=dynamic_providers,
+            DYNAMIC_VOLATILE=dynamic_volatile,
+        )
+        conf.run()
+        if variables is not None:
+            dynamic_providers = {
+                k: v for k, v in dynamic_providers.items() if k in variables
+            }
+        dynamic_vars.update(self._run_providers(dynamic_providers))
+        # the dynamic file runs from its directory, relative paths are relative
+        # to it
+        root = self.dynamic_file.parent.resolve()
+        dynamic_depends = [str(root / Path(path)) for path in dynamic_depends]
+        return dynamic_vars, dynamic_depends, [*dynamic_volatile]
+
     def run(
         self,
         static_vars: dict = {},
         template: Union[TextIOWrapper, Path] = None,
         destination: Union[TextIOWrapper, Path] = None,
         run_cwd: Path = Path.cwd(),
+        variables: Optional[set] = None,
     ):
         """Runs the python dynamic.py file and returns the variable name and value
         dictionary.
 
         Args:
             static_vars: The variable names and values from static storage.
-            template: The template file.
-            destination: The destination file.
+            template: The template file or its path, None for stdin.
+            destination: The destination file or its path, None for stdout.
             run_cwd: The directory in which the clinja command is run.
+            variables: Names of the variables needed, only the providers of these
+                variables are called. If None, all the providers are called.
 
         Returns:
             The variable name and values after running the file.
         """
         if isinstance(template, TextIOWrapper):
             template = self._get_io_path(template)
-        if isinstance(destination, (click.utils.LazyFile, TextIOWrapper)):
+        if isinstance(destination, TextIOWrapper):
             destination = self._get_io_path(destination)
         if template is not None:
             template = template.resolve()
         if destination is not None:
             destination = destination.resolve()
 
-        dynamic_vars = {}
-        conf = PyFile(self.dynamic_file)
-        conf.provide(
+        inputs = dict(
             TEMPLATE=template,
             DESTINATION=destination,
             RUN_CWD=run_cwd.resolve(),
             STATIC_VARS=static_vars.copy(),
-            DYNAMIC_VARS=dynamic_vars,
         )
-        conf_module = conf.run()
+        self.from_cache = False
+        sorted_variables = None if variables is None else sorted(variables)
+        if self.memoize:
+            memo_key = json.dumps(
+                {**inputs, "variables": sorted_variables}, sort_keys=True, default=str
+            )
+            memoized = self._memo_load(memo_key)
+            if memoized is not None:
+                self.from_cache = True
+                dynamic_vars, self.depends = memoized
+                return dynamic_vars
+        if self.cache_ttl is not None:
+            cache_path = self._cache_path(**inputs, variables=sorted_variables)
+            cached = self._cache_load(cache_path)
+            if cached is not None:
+                self.from_cache = True
+                dynamic_vars, self.depends = cached
+                return dynamic_vars
+
+        run_time = time.time()
+        # the file might change while it runs
+        file_state = self._file_states([self.dynamic_file])
+        if self.worker is not None:
+            dynamic_vars, dynamic_depends, dynamic_volatile = self.worker.run(
+                self, inputs, variables
+            )
+        else:
+            dynamic_vars, dynamic_depends, dynamic_volatile = self.execute(
+                inputs, variables
+            )
+        self.depends = [*dynamic_depends]
+
+        # volatile values are recomputed on each run
+        volatile = set(dynamic_volatile)
+        if variables is not None:
+            volatile &= set(variables)
+        if volatile:
+            return dynamic_vars
+        if self.memoize:
+            states = {**file_state, **self._file_states(dynamic_depends)}
+            self._memo[memo_key] = (run_time, dynamic_vars.copy(), states)
+        if self.cache_ttl is not None:
+            self._cache_dump(cache_path, dynamic_vars, dynamic_depends)
         return dynamic_vars
 
 
@@ -81,12 +430,15 @@ class ClinjaStatic:
         """Handles clinja's static variable names and values.
 
         Args:
-            static_file: Path of the static json file.
+            static_file: Path of the static file, ".db", ".sqlite" and ".sqlite3"
+                files are SQLite databases, other files are json files.
 
         Attributes:
-            static_file: Path of the static json file.
+            static_file: Path of the static file.
+            storage: Storage backend of the static file.
         """
         self.static_file = static_file
+        self.storage = open_storage(static_file)
         self._stored = None
 
     @property
@@ -96,14 +448,13 @@ class ClinjaStatic:
             Stored variable names and values.
         """
         if self._stored is None:
-            with open(self.static_file, "r") as fp:
-                self._stored = json.load(fp)
+            self._stored = self.storage.load()
         return self._stored
 
-    def _write(self):
-        """Write `self.stored` to file."""
-        with open(self.static_file, "w") as fp:
-            json.dump(self.stored, fp, indent=4, sort_keys=True)
+    def reload(self):
+        """Discard the loaded values, they are read from file on next access."""
+        self._stored = None
+        self.storage.reload()
 
     def list(self, pattern=None):
         """Print the stored variable names and values.
@@ -114,11 +465,7 @@ class ClinjaStatic:
         Returns:
             Iterable on key value pairs of stored variables.
         """
-        if pattern is not None:
-            pattern = re.compile(pattern)
-            return ((k, v) for k, v in self.stored.items() if re.search(pattern, k))
-        else:
-            return self.stored.items()
+        return self.storage.items(pattern=pattern)
 
     def add(self, variable_name: str, value: Any, force: bool = False):
         """Add a variable name and value to static storage.
@@ -133,14 +480,17 @@ class ClinjaStatic:
             ValueError: if `force` is False and `variable_name` already exists.
         """
         variable_name = sanitize_variable_name(variable_name)
-        if (
-            not force
-            and variable_name in self.stored.keys()
-            and self.stored[variable_name] != value
-        ):
-            raise ValueError(f'"{variable_name}" already in store.')
-        self.stored[variable_name] = value
-        self._write()
+        if not force:
+            try:
+                current = self.storage.get(variable_name)
+            except KeyError:
+                pass
+            else:
+                if current != value:
+                    raise ValueError(f'"{variable_name}" already in store.')
+        self.storage.set(variable_name, value)
+        if self._stored is not None:
+            self._stored[variable_name] = value
 
     def remove(self, variable_name: str):
         """Remove a variable from the static storage.
@@ -148,5 +498,59 @@ class ClinjaStatic:
         Args:
             variable_name: Variable to remove from the store.
         """
-        del self.stored[variable_name]
-        self._write()
+        self.storage.delete(variable_name)
+        if self._stored is not None:
+            self._stored.pop(variable_name, None)
+
+    def update(self, values: dict, force: bool = False):
+        """Add many variable names and values to static storage, in a single write.
+
+        Args:
+            values: jinja variable names and values.
+            force: if True will overwrite any existing values. if False will raise
+                ValueError if any of the variable names is already used, and
+                nothing is added.
+
+        Raises:
+            ValueError: if `force` is False and any variable name already exists.
+        """
+        values = {sanitize_variable_name(k): v for k, v in values.items()}
+        if not force:
+            conflicts = sorted(
+                k for k, v in self.list() if k in values and values[k] != v
+            )
+            if conflicts:
+                raise ValueError(f"{', '.join(map(repr, conflicts))} already in store.")
+        self.storage.update(values)
+        if self._stored is not None:
+            self._stored.update(values)
+
+    def remove_many(self, variable_names: Iterable[str]) -> List[str]:
+        """Remove many variables from the static storage, in a single write.
+
+        Args:
+            variable_names: Variables to remove from the store.
+
+        Returns:
+            The variable names which were not in the store.
+        """
+        variable_names = [*variable_names]
+        missing = self.storage.delete_many(variable_names)
+        if self._stored is not None:
+            for variable_name in variable_names:
+                self._stored.pop(variable_name, None)
+        return missing
+
+    def migrate(self, destination: Path) -> "ClinjaStatic":
+        """Copy the stored variables to another static file, in a single write.
+
+        Args:
+            destination: Path of the new static file, its extension selects the
+                storage backend.
+
+        Returns:
+            The static variables of the new static file.
+        """
+        migrated = ClinjaStatic(static_file=destination)
+        migrated.storage.update(dict(self.list()))
+        return migrated
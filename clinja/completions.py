@@ -1,7 +1,88 @@
+import os
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional
+
 from click.shell_completion import BashComplete, FishComplete, ZshComplete
 
 from .clinja import ClinjaStatic
-from .settings import STATIC_FILE
+from .settings import get_static_file
+from .storage import open_storage, storage_state
+
+
+class VariableIndex:
+    def __init__(self, static_file: Optional[Path] = None):
+        """Sorted index of the static variable names, kept next to the static file
+        and rebuilt when the static file changes.
+
+        Listing the variable names of an SQLite static file doesn't load the
+        values either, the index then only avoids opening the database.
+
+        Args:
+            static_file: Path of the static file, the one in use by default.
+
+        Attributes:
+            index_file: Path of the index file.
+        """
+        if static_file is None:
+            static_file = get_static_file()
+        self.static_file = Path(static_file)
+        self.index_file = self.static_file.with_name(f".{self.static_file.name}.index")
+
+    def _static_state(self) -> str:
+        return storage_state(self.static_file)
+
+    def _build(self, state: str) -> List[str]:
+        """Build the index from the static file.
+
+        Args:
+            state: State of the static file when the index is built.
+
+        Returns:
+            The sorted variable names.
+        """
+        keys = sorted(open_storage(self.static_file).keys())
+        tmp_file = self.index_file.with_name(f"{self.index_file.name}.{os.getpid()}")
+        try:
+            with open(tmp_file, "w") as fp:
+                fp.write("\n".join([state, *keys]))
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            # the index is only an optimization
+            pass
+        return keys
+
+    def keys(self) -> List[str]:
+        """
+        Returns:
+            The sorted variable names.
+        """
+        state = self._static_state()
+        try:
+            with open(self.index_file, "r") as fp:
+                lines = fp.read().split("\n")
+        except OSError:
+            lines = []
+        if not lines or lines[0] != state:
+            return self._build(state)
+        return [k for k in lines[1:] if k]
+
+    def prefixed(self, prefix: str) -> List[str]:
+        """Find the variable names starting with a prefix.
+
+        Args:
+            prefix: Prefix of the variable names.
+
+        Returns:
+            The sorted variable names starting with `prefix`.
+        """
+        keys = self.keys()
+        out = []
+        for k in keys[bisect_left(keys, prefix) :]:
+            if not k.startswith(prefix):
+                break
+            out.append(k)
+        return out
 
 
 def get_completions(ctx, command, shell: str = "bash"):
@@ -14,15 +95,40 @@ def get_completions(ctx, command, shell: str = "bash"):
     return completion.source()
 
 
-def variable_names(ctx, args, incomplete, static_file=STATIC_FILE):
-    static = ClinjaStatic(static_file=static_file)
-    return [k for k in static.stored.keys() if incomplete in k and k not in args[1:]]
+def _typed_args(ctx, args) -> list:
+    """Arguments typed so far, with the subcommand name first.
+
+    click >= 8 passes the completed parameter instead of the typed arguments,
+    these are then taken from the parsed parameters.
+    """
+    if isinstance(args, (list, tuple)):
+        return args
+    typed = [ctx.info_name]
+    for param in ctx.command.params:
+        if param.param_type_name != "argument":
+            continue
+        value = ctx.params.get(param.name)
+        if value is None or value == "":
+            continue
+        typed.extend(value if isinstance(value, (list, tuple)) else [value])
+    return typed
+
+
+def variable_names(ctx, args, incomplete, static_file=None):
+    args = _typed_args(ctx, args)
+    index = VariableIndex(static_file=static_file)
+    return [k for k in index.prefixed(incomplete) if k not in args[1:]]
 
 
-def variable_value(ctx, args, incomplete, static_file=STATIC_FILE):
-    static = ClinjaStatic(static_file=static_file)
-    variable_name = args[-1]
-    if len(args) == 2 and variable_name in static.stored.keys():
-        return [static.stored[variable_name]]
+def variable_value(ctx, args, incomplete, static_file=None):
+    typed = _typed_args(ctx, args)
+    variable_name = typed[-1]
+    index = VariableIndex(static_file=static_file)
+    if len(typed) == 2 and variable_name in index.keys():
+        # only load the values when needed
+        static = ClinjaStatic(static_file=index.static_file)
+        value = static.stored[variable_name]
+        # click >= 8 only completes strings
+        return [value if typed is args else str(value)]
     else:
         return []
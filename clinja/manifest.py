@@ -0,0 +1,216 @@
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .settings import MANIFEST_FILE
+
+
+def digest(contents: str) -> str:
+    """
+    Args:
+        contents: Contents to hash.
+
+    Returns:
+        The hex digest of the contents.
+    """
+    return sha256(contents.encode("utf8")).hexdigest()
+
+
+def variables_digest(variables: Iterable[str], all_vars: dict) -> str:
+    """Hash the values of the variables consumed by a render.
+
+    Args:
+        variables: Variable names, those without a value are ignored.
+        all_vars: Variable names and values.
+
+    Returns:
+        The hex digest of the consumed variables and their values.
+    """
+    consumed = {k: all_vars[k] for k in variables if k in all_vars}
+    return digest(json.dumps(consumed, sort_keys=True, default=str))
+
+
+class Manifest:
+    def __init__(self, manifest_file: Optional[Path] = MANIFEST_FILE):
+        """Inputs of each rendered destination, used to only re-render the
+        destinations whose inputs changed.
+
+        Each destination records the hash of its template, of the templates it
+        includes or imports and of the variable values it consumed, along with
+        its own size and modification time, to catch changes made by hand.
+
+        Args:
+            manifest_file: Path of the json manifest file, if None the manifest
+                is only kept in memory.
+        """
+        self.manifest_file = manifest_file
+        self._entries = None
+        self._changes = {}
+        self._sources = {}
+
+    @property
+    def entries(self) -> dict:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self) -> dict:
+        if self.manifest_file is None:
+            return {}
+        try:
+            with open(self.manifest_file, "r") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def forget_sources(self):
+        """Forget the hashes of the referenced templates, to pick up their
+        changes."""
+        self._sources = {}
+
+    def include_digests(
+        self, environment, references: Iterable[Optional[str]]
+    ) -> Optional[dict]:
+        """Hash the templates included or imported by a template, recursively.
+
+        Args:
+            environment: jinja environment whose loader resolves the templates.
+            references: Names of the referenced templates, None for names only
+                known at render time.
+
+        Returns:
+            The hex digest of each referenced template's source, None if a
+            reference can't be known before rendering.
+        """
+        from jinja2.meta import find_referenced_templates
+
+        digests = {}
+        pending = [*references]
+        while pending:
+            name = pending.pop()
+            if name is None:
+                return None
+            if name in digests:
+                continue
+            if name not in self._sources:
+                # a missing template fails the render, record it as such
+                source, nested = None, []
+                if environment.loader is not None:
+                    try:
+                        source = environment.loader.get_source(environment, name)[0]
+                        nested = find_referenced_templates(environment.parse(source))
+                    except Exception:
+                        pass
+                self._sources[name] = (
+                    None if source is None else digest(source),
+                    [*nested],
+                )
+            digests[name], nested = self._sources[name]
+            pending.extend(nested)
+        return digests
+
+    def entry(
+        self,
+        template_digest: str,
+        variables: set,
+        references: Iterable[Optional[str]],
+        all_vars: dict,
+        environment=None,
+        includes: Optional[dict] = None,
+    ) -> dict:
+        """Describe the inputs of a render.
+
+        Args:
+            template_digest: Hex digest of the template's contents.
+            variables: Undeclared variables of the template, and of the
+                templates it references.
+            references: Names of the templates it includes or imports.
+            all_vars: Variable names and values of the render.
+            environment: jinja environment whose loader resolves the referenced
+                templates.
+            includes: Digests of the referenced templates, as returned by
+                `include_digests`, used when there is no environment to hash
+                them with.
+
+        Returns:
+            The manifest entry of the render, without the destination state.
+        """
+        references = [*references]
+        if environment is not None:
+            includes = self.include_digests(environment, references)
+        return {
+            "template": template_digest,
+            "includes": includes,
+            "variables": variables_digest(variables, all_vars),
+        }
+
+    @staticmethod
+    def _state(destination: Path) -> Optional[list]:
+        try:
+            stat = destination.stat()
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def is_fresh(self, destination: Path, entry: dict) -> bool:
+        """Check if a destination is up to date.
+
+        Args:
+            destination: Path of the destination.
+            entry: Manifest entry of the render.
+
+        Returns:
+            Whether the destination was rendered from the same inputs and was not
+            changed since.
+        """
+        if entry["includes"] is None:
+            return False
+        recorded = self.entries.get(str(destination.resolve()))
+        if recorded is None:
+            return False
+        state = self._state(destination)
+        return state is not None and recorded == {**entry, "state": state}
+
+    def set(self, destination: Path, entry: dict):
+        """Record the inputs of a destination, after it was rendered.
+
+        Args:
+            destination: Path of the destination.
+            entry: Manifest entry of the render.
+        """
+        key = str(destination.resolve())
+        self._changes[key] = self.entries[key] = {
+            **entry,
+            "state": self._state(destination),
+        }
+
+    def save(self):
+        """Write the recorded entries, merged with the entries written by other
+        runs in the meantime."""
+        if not self._changes or self.manifest_file is None:
+            return
+        entries = {**self._read(), **self._changes}
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_file.with_name(
+            f".{self.manifest_file.name}.{os.getpid()}"
+        )
+        with open(tmp_path, "w") as fp:
+            json.dump(entries, fp)
+        os.replace(tmp_path, self.manifest_file)
+        self._entries = entries
+        self._changes = {}
+
+    def clear(self) -> int:
+        """Remove all the entries.
+
+        Returns:
+            The number of removed entries.
+        """
+        removed = len(self._read())
+        if self.manifest_file is not None and self.manifest_file.exists():
+            self.manifest_file.unlink()
+        self._entries = None
+        self._changes = {}
+        return removed
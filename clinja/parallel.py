@@ -0,0 +1,304 @@
+import marshal
+import signal
+from multiprocessing import Pool
+from pathlib import Path
+from io import StringIO
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import TemplateCache
+from .manifest import digest
+from .template import CompiledTemplates, Template, compile_template, get_environment
+
+# number of templates rendered by each task, the variables are sent once per
+# task
+_BATCH_SIZE = 16
+
+# merged variables and render options, set once per worker by the pool
+# initializer.
+_ALL_VARS = {}
+_CACHE = None
+_BUFFER_SIZE = 1
+_SKIP_UNCHANGED = False
+# template rendered once per record, compiled once per worker
+_TEMPLATE = None
+# compiled template set the templates are loaded from, if any
+_COMPILED = None
+
+
+def _init_worker(
+    all_vars: dict,
+    cache: Optional[TemplateCache],
+    buffer_size: int,
+    skip_unchanged: bool = False,
+    search_path: Optional[List[Path]] = None,
+    compiled: Optional[Path] = None,
+):
+    global _ALL_VARS, _CACHE, _BUFFER_SIZE, _SKIP_UNCHANGED, _COMPILED
+    # the pool can idle while the parent prompts, interruptions are handled by
+    # the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    get_environment(search_path)
+    if compiled is not None:
+        _COMPILED = CompiledTemplates(compiled)
+    _ALL_VARS = all_vars
+    _CACHE = cache
+    _BUFFER_SIZE = buffer_size
+    _SKIP_UNCHANGED = skip_unchanged
+
+
+def _init_record_worker(
+    contents: str,
+    all_vars: dict,
+    cache: Optional[TemplateCache],
+    buffer_size: int,
+    skip_unchanged: bool = False,
+    search_path: Optional[List[Path]] = None,
+):
+    global _TEMPLATE
+    _init_worker(all_vars, cache, buffer_size, skip_unchanged, search_path)
+    _TEMPLATE = Template(StringIO(contents), cache=cache)
+
+
+def _parse(
+    template_path: Path,
+) -> Tuple[
+    Optional[Tuple[set, List[Optional[str]], str]], Optional[str], Optional[bytes]
+]:
+    """Parse and compile a template, and find its undeclared variables.
+
+    Args:
+        template_path: Path of the template.
+
+    Returns:
+        The undeclared variables, referenced templates and digest of the
+        template, an error message, if any, and the marshalled compiled code of
+        the template, rendered without compiling it again.
+    """
+    try:
+        with open(template_path, "r") as fp:
+            contents = fp.read()
+        variables, code, references = compile_template(
+            contents, get_environment(), cache=_CACHE
+        )
+        info = (variables, references, digest(contents))
+        return info, None, marshal.dumps(code)
+    except Exception as e:
+        return None, f"{template_path}: {e}", None
+
+
+def _render(
+    all_vars: dict, template_path: Path, destination_path: Path, code: Optional[bytes]
+) -> Tuple[Optional[str], bool]:
+    """Render a template to its destination.
+
+    Args:
+        all_vars: Merged variable names and values.
+        template_path: Path of the template, its name when the templates are
+            compiled ahead of time.
+        destination_path: Path of the destination.
+        code: Marshalled compiled code of the template, the template is loaded
+            or compiled if None.
+
+    Returns:
+        An error message, if any, and whether the destination was written.
+    """
+    try:
+        if code is not None:
+            environment = get_environment()
+            template = Template.from_code(
+                environment, marshal.loads(code), environment.make_globals(None)
+            )
+        elif _COMPILED is not None:
+            template = Template.from_compiled(_COMPILED, template_path)
+        else:
+            with open(template_path, "r") as fp:
+                template = Template(fp, cache=_CACHE)
+        written = template.dump_file(
+            all_vars,
+            destination_path,
+            buffer_size=_BUFFER_SIZE,
+            skip_unchanged=_SKIP_UNCHANGED,
+        )
+    except Exception as e:
+        return f"{template_path}: {e}", False
+    return None, written
+
+
+def _render_batch(
+    batch: Tuple[dict, List[Tuple[Path, Path, Optional[bytes]]]],
+) -> List[Tuple[Optional[str], bool]]:
+    """Render a batch of templates, the variables are sent once per batch.
+
+    Args:
+        batch: Merged variable names and values, and the template path,
+            destination path and compiled code of each template.
+
+    Returns:
+        An error message, if any, and whether the destination was written, for
+        each template.
+    """
+    all_vars, tasks = batch
+    return [_render(all_vars, *task) for task in tasks]
+
+
+def _render_record(task: Tuple[int, dict, Path]) -> Tuple[int, Optional[str], bool]:
+    """Render the worker's template with a record's values.
+
+    Args:
+        task: Record index, record values and destination path.
+
+    Returns:
+        The record index, an error message, if any, and whether the destination
+        was written.
+    """
+    index, record, destination_path = task
+    try:
+        written = _TEMPLATE.dump_file(
+            {**_ALL_VARS, **record},
+            destination_path,
+            buffer_size=_BUFFER_SIZE,
+            skip_unchanged=_SKIP_UNCHANGED,
+        )
+    except Exception as e:
+        return index, f"Record {index}: {e}", False
+    return index, None, written
+
+
+def template_pool(
+    jobs: int,
+    cache: Optional[TemplateCache] = None,
+    buffer_size: int = 1,
+    skip_unchanged: bool = False,
+    search_path: Optional[List[Path]] = None,
+    compiled: Optional[Path] = None,
+) -> Pool:
+    """Start the process pool which parses, then renders, many templates.
+
+    Args:
+        jobs: Number of worker processes.
+        cache: Compiled template cache.
+        buffer_size: Number of rendered chunks to buffer before each write.
+        skip_unchanged: Leave the destinations whose contents wouldn't change
+            untouched.
+        search_path: Directories in which included and imported templates are
+            looked up.
+        compiled: Directory or zip file of templates compiled ahead of time,
+            the templates are loaded from it.
+
+    Returns:
+        The process pool, to be terminated by the caller.
+    """
+    return Pool(
+        jobs,
+        initializer=_init_worker,
+        initargs=({}, cache, buffer_size, skip_unchanged, search_path, compiled),
+    )
+
+
+def parallel_parse(template_paths: Iterable[Path], pool: Pool) -> Tuple[
+    List[Optional[Tuple[set, List[Optional[str]], str]]],
+    List[str],
+    List[Optional[bytes]],
+]:
+    """Parse and compile many templates using a pool started by
+    `template_pool`.
+
+    Returns:
+        The undeclared variables, referenced templates and digest of each
+        template, None for the templates which failed to parse, the error
+        messages, and the marshalled compiled code of each template, in
+        template order.
+    """
+    results = pool.map(_parse, template_paths)
+    return (
+        [r[0] for r in results],
+        [r[1] for r in results if r[1] is not None],
+        [r[2] for r in results],
+    )
+
+
+def parallel_render(
+    pairs: Iterable[Tuple[Path, Path]],
+    all_vars: dict,
+    pool: Pool,
+    codes: Optional[Iterable[Optional[bytes]]] = None,
+) -> Tuple[Dict[Path, str], int]:
+    """Render many templates using a pool started by `template_pool`.
+
+    Args:
+        pairs: Template and destination paths, template names when the pool
+            loads compiled templates.
+        all_vars: Merged variable names and values.
+        pool: Process pool.
+        codes: Marshalled compiled code of each template, as returned by
+            `parallel_parse`, the workers don't compile them again.
+
+    Returns:
+        The error messages keyed by template path, in template order, and the
+        number of destinations written.
+    """
+    pairs = [*pairs]
+    codes = [None] * len(pairs) if codes is None else [*codes]
+    tasks = [(t, d, code) for (t, d), code in zip(pairs, codes)]
+    batches = [
+        (all_vars, tasks[i : i + _BATCH_SIZE])
+        for i in range(0, len(tasks), _BATCH_SIZE)
+    ]
+    results = [r for batch in pool.map(_render_batch, batches) for r in batch]
+    errors = {
+        template_path: error
+        for (template_path, _), (error, _) in zip(pairs, results)
+        if error is not None
+    }
+    return errors, sum(written for _, written in results)
+
+
+def parallel_render_records(
+    contents: str,
+    tasks: Iterable[Tuple[int, dict, Path]],
+    all_vars: dict,
+    jobs: int,
+    cache: Optional[TemplateCache] = None,
+    buffer_size: int = 1,
+    skip_unchanged: bool = False,
+    search_path: Optional[List[Path]] = None,
+) -> Tuple[Dict[int, str], int]:
+    """Render a template once per record using a process pool.
+
+    Args:
+        contents: Contents of the template, compiled once in each worker.
+        tasks: Record indices, record values and destination paths, consumed
+            lazily.
+        all_vars: Merged variable names and values, the record values take
+            precedence.
+        jobs: Number of worker processes.
+        cache: Compiled template cache.
+        buffer_size: Number of rendered chunks to buffer before each write.
+        skip_unchanged: Leave the destinations whose contents wouldn't change
+            untouched.
+        search_path: Directories in which included and imported templates are
+            looked up.
+
+    Returns:
+        The error messages, keyed by record index, and the number of
+        destinations written.
+    """
+    errors = {}
+    written_count = 0
+    with Pool(
+        jobs,
+        initializer=_init_record_worker,
+        initargs=(
+            contents,
+            all_vars,
+            cache,
+            buffer_size,
+            skip_unchanged,
+            search_path,
+        ),
+    ) as pool:
+        for index, error, written in pool.imap(_render_record, tasks, chunksize=16):
+            if error is not None:
+                errors[index] = error
+            written_count += written
+    return errors, written_count
@@ -0,0 +1,148 @@
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Callable, Optional
+
+# the package imports this module first, the startup phase is measured from
+# here
+_START = time.perf_counter()
+# phase name to total seconds and number of calls, None when profiling is
+# disabled
+_PHASES = None
+_DYNAMIC_STATS_FILE = None
+
+
+def enable(dynamic_stats_file: Optional[Path] = None):
+    """Start recording the run phases' timings.
+
+    The time elapsed since clinja was imported is recorded as the "startup"
+    phase.
+
+    Args:
+        dynamic_stats_file: If provided, the execution of the dynamic source is
+            profiled with cProfile and its stats dumped to this file.
+    """
+    global _PHASES, _DYNAMIC_STATS_FILE
+    _PHASES = {}
+    _DYNAMIC_STATS_FILE = dynamic_stats_file
+    add("startup", time.perf_counter() - _START)
+
+
+def disable():
+    """Stop recording the run phases' timings."""
+    global _PHASES, _DYNAMIC_STATS_FILE
+    _PHASES = None
+    _DYNAMIC_STATS_FILE = None
+
+
+def enabled() -> bool:
+    return _PHASES is not None
+
+
+def reset():
+    """Forget the recorded timings, the total is measured from now on."""
+    global _START
+    if _PHASES is not None:
+        _PHASES.clear()
+    _START = time.perf_counter()
+
+
+def add(name: str, seconds: float, calls: int = 1):
+    """Record time spent in a phase.
+
+    Args:
+        name: Name of the phase.
+        seconds: Time spent in the phase.
+        calls: Number of times the phase was entered.
+    """
+    if _PHASES is None:
+        return
+    total = _PHASES.setdefault(name, [0.0, 0])
+    total[0] += seconds
+    total[1] += calls
+
+
+@contextmanager
+def phase(name: str):
+    """Record the time spent in the block as a phase."""
+    if _PHASES is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - start)
+
+
+def profiled(func: Callable, *args, **kwargs) -> Any:
+    """Call the dynamic source, under cProfile if requested.
+
+    Args:
+        func: Function to call.
+        *args: Positional arguments of `func`.
+        **kwargs: Keyword arguments of `func`.
+
+    Returns:
+        The return value of `func`.
+    """
+    if _DYNAMIC_STATS_FILE is None:
+        return func(*args, **kwargs)
+    import cProfile
+
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(str(_DYNAMIC_STATS_FILE))
+
+
+class TimedWriter:
+    def __init__(self, fp: IO):
+        """File object wrapper measuring the time spent writing.
+
+        Args:
+            fp: File object to write to.
+
+        Attributes:
+            seconds: Time spent writing.
+        """
+        self.fp = fp
+        self.seconds = 0.0
+
+    def write(self, data: str):
+        start = time.perf_counter()
+        self.fp.write(data)
+        self.seconds += time.perf_counter() - start
+
+
+def report(fmt: str = "text") -> str:
+    """Format the recorded timings.
+
+    Args:
+        fmt: "text" for a human readable table, "json" for a json object.
+
+    Returns:
+        The timings of each phase, in recording order, and the total time.
+    """
+    total = time.perf_counter() - _START
+    phases = _PHASES or {}
+    if fmt == "json":
+        import json
+
+        return json.dumps(
+            {
+                "phases": {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in phases.items()
+                },
+                "total": total,
+            }
+        )
+    width = max(map(len, [*phases.keys(), "total"]))
+    lines = [
+        f"{name:<{width}} {seconds * 1000:>10.2f} ms {calls:>6}x"
+        for name, (seconds, calls) in phases.items()
+    ]
+    lines.append(f"{'total':<{width}} {total * 1000:>10.2f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+import marshal
+import os
+from hashlib import sha256
+from importlib.util import MAGIC_NUMBER
+from pathlib import Path
+from types import CodeType
+from typing import Dict, Optional, Tuple
+
+from myopy import PyFile
+
+# code of the python files compiled by this process, by resolved path, with the
+# modification time and size of the file it was compiled from
+_CODE: Dict[str, Tuple[Tuple[int, int], CodeType]] = {}
+
+
+class CachedPyFile(PyFile):
+    def __init__(
+        self, file_path: Path, code_cache_dir: Optional[Path] = None, **kwargs
+    ):
+        """PyFile which compiles its file once per process, and only once per
+        change of the file when the compiled code is persisted.
+
+        Args:
+            file_path: python file.
+            code_cache_dir: Directory in which to persist the compiled code, in
+                the same spirit as python's .pyc files. If None, the code is only
+                kept in memory.
+            **kwargs: Keyword arguments of PyFile.
+        """
+        super().__init__(file_path, **kwargs)
+        self.code_cache_dir = code_cache_dir
+
+    def _cache_path(self, path: str) -> Path:
+        return self.code_cache_dir / sha256(path.encode("utf8")).hexdigest()
+
+    def _cache_load(self, path: str, state: Tuple[int, int]) -> Optional[CodeType]:
+        """Load persisted code, if it was compiled from the current file by this
+        python version.
+
+        Args:
+            path: Resolved path of the python file.
+            state: Modification time and size of the python file.
+
+        Returns:
+            The compiled code, None if missing or stale.
+        """
+        try:
+            with open(self._cache_path(path), "rb") as fp:
+                magic, cached_state, code = marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if magic != MAGIC_NUMBER or tuple(cached_state) != state:
+            return None
+        return code
+
+    def _cache_dump(self, path: str, state: Tuple[int, int], code: CodeType):
+        """Persist compiled code, a single entry is kept per python file.
+
+        Args:
+            path: Resolved path of the python file.
+            state: Modification time and size of the python file.
+            code: Compiled code.
+        """
+        cache_path = self._cache_path(path)
+        tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+        try:
+            self.code_cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(marshal.dumps((MAGIC_NUMBER, state, code)))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+    def _compile(self) -> CodeType:
+        """Compile the python file, unless it is unchanged since last compiled."""
+        path = str(self.file_path.resolve())
+        stat = os.stat(path)
+        state = (stat.st_mtime_ns, stat.st_size)
+        cached = _CODE.get(path)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        code = None
+        if self.code_cache_dir is not None:
+            code = self._cache_load(path, state)
+        if code is None:
+            code = super()._compile()
+            if self.code_cache_dir is not None:
+                self._cache_dump(path, state, code)
+        _CODE[path] = (state, code)
+        return code
@@ -0,0 +1,205 @@
+import math
+import os
+import pickle
+import signal
+from multiprocessing import Pipe, Process
+from typing import Optional, Tuple
+
+
+def _set_limit(kind: str, soft: int):
+    """Lower a resource's soft limit, if the platform supports it.
+
+    Args:
+        kind: Name of the resource limit in the resource module.
+        soft: New soft limit, capped by the hard limit.
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    kind = getattr(resource, kind)
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _cpu_time() -> float:
+    """
+    Returns:
+        The CPU time used by this process, in seconds.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _serve(conn, memory_limit: Optional[int]):
+    """Worker loop, runs the dynamic file for each request until the pipe is
+    closed.
+
+    Args:
+        conn: Worker end of the pipe.
+        memory_limit: Maximum address space of the worker, in bytes.
+    """
+    from .clinja import ClinjaDynamic
+
+    # interruptions are handled by the parent, which stops the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit is not None:
+        _set_limit("RLIMIT_AS", memory_limit)
+    while True:
+        try:
+            request = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            return
+        (
+            dynamic_file,
+            code_cache_dir,
+            provider_timeout,
+            inputs,
+            variables,
+            cpu_limit,
+        ) = request
+        if cpu_limit is not None:
+            # the limit is on the worker's total CPU time
+            _set_limit("RLIMIT_CPU", math.ceil(_cpu_time() + cpu_limit))
+        dynamic = ClinjaDynamic(
+            dynamic_file,
+            provider_timeout=provider_timeout,
+            code_cache_dir=code_cache_dir,
+            memoize=False,
+        )
+        try:
+            response = ("result", dynamic.execute(inputs, variables))
+            data = pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            try:
+                data = pickle.dumps(("error", e), protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                error = RuntimeError(f"{type(e).__name__}: {e}")
+                data = pickle.dumps(("error", error))
+        conn.send_bytes(data)
+
+
+class DynamicWorker:
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        cpu_limit: Optional[float] = None,
+    ):
+        """Runs the dynamic file in a separate process, reused across runs.
+
+        A run which times out or exceeds its limits stops the worker, a new
+        worker is started for the next run.
+
+        Args:
+            timeout: Wall clock timeout of each run, in seconds. If None, runs
+                can last indefinitely.
+            memory_limit: Maximum address space of the worker, in bytes.
+            cpu_limit: Maximum CPU time of each run, in seconds.
+        """
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self._process = None
+        self._conn = None
+
+    def start(self):
+        """Start the worker, if it isn't running."""
+        if self._process is not None and self._process.is_alive():
+            return
+        self.close()
+        conn, worker_conn = Pipe()
+        self._process = Process(
+            target=_serve, args=(worker_conn, self.memory_limit), daemon=True
+        )
+        self._process.start()
+        worker_conn.close()
+        self._conn = conn
+
+    def close(self):
+        """Stop the worker."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            if self._process.is_alive():
+                # Process.kill is only available on python 3.7+
+                os.kill(self._process.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            self._process.join()
+            self._process = None
+
+    def _died(self) -> Exception:
+        """Stop the worker after it died during a run.
+
+        Returns:
+            The error to raise.
+        """
+        self._process.join()
+        exitcode = self._process.exitcode
+        self.close()
+        if exitcode == -getattr(signal, "SIGXCPU", 0):
+            return TimeoutError(
+                f"The dynamic file exceeded its CPU time limit of {self.cpu_limit}s."
+            )
+        return RuntimeError(f"The dynamic worker died with exit code {exitcode}.")
+
+    def run(
+        self, dynamic, inputs: dict, variables: Optional[set] = None
+    ) -> Tuple[dict, list, list]:
+        """Run the dynamic file in the worker.
+
+        Args:
+            dynamic: ClinjaDynamic instance whose file to run.
+            inputs: The variables provided to the dynamic file.
+            variables: Names of the variables needed, only the providers of these
+                variables are called. If None, all the providers are called.
+
+        Returns:
+            The dynamic variables, and the DYNAMIC_DEPENDS paths and
+            DYNAMIC_VOLATILE names populated by the dynamic file.
+
+        Raises:
+            TimeoutError: if the run exceeded its timeout or CPU time limit.
+            MemoryError: if the run exceeded the memory limit.
+            RuntimeError: if the worker died.
+        """
+        self.start()
+        request = (
+            dynamic.dynamic_file,
+            dynamic.code_cache_dir,
+            dynamic.provider_timeout,
+            inputs,
+            variables,
+            self.cpu_limit,
+        )
+        try:
+            self._conn.send_bytes(pickle.dumps(request))
+        except OSError:
+            raise self._died()
+        if not self._conn.poll(self.timeout):
+            self.close()
+            raise TimeoutError(f"The dynamic file timed out after {self.timeout}s.")
+        try:
+            status, payload = pickle.loads(self._conn.recv_bytes())
+        except (EOFError, OSError):
+            raise self._died()
+        if status == "error":
+            if isinstance(payload, MemoryError) and self.memory_limit is not None:
+                raise MemoryError(
+                    "The dynamic file exceeded its memory limit of "
+                    f"{self.memory_limit} bytes."
+                )
+            raise payload
+        return payload
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
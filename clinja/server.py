@@ -0,0 +1,152 @@
+import json
+import socketserver
+from collections import OrderedDict
+from io import StringIO
+from pathlib import Path
+from typing import Any, List, Optional
+
+from .settings import SOCKET_FILE
+from .storage import storage_state
+from .template import Template, get_environment
+from .utils import get_prompt_vars
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # one json request per line, a connection can hold several requests
+        for line in self.rfile:
+            response = self.server.dispatch(json.loads(line))
+            self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf8"))
+
+
+class ClinjaServer(socketserver.UnixStreamServer):
+    def __init__(self, obj: dict, socket_file: Path = SOCKET_FILE, max_templates=256):
+        """Serves clinja requests on a unix socket, keeping the static values and
+        the compiled templates in memory between requests.
+
+        Args:
+            obj: Clinja's context object, with the "static" and "dynamic"
+                sources.
+            socket_file: Path of the unix socket.
+            max_templates: Maximum number of compiled templates kept in memory.
+        """
+        self.obj = obj
+        self.socket_file = socket_file
+        self.max_templates = max_templates
+        self._templates = OrderedDict()
+        self._static_state = None
+        if socket_file.is_socket():
+            # left over by a daemon which didn't shut down cleanly
+            socket_file.unlink()
+        super().__init__(str(socket_file), _RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if self.socket_file.is_socket():
+            self.socket_file.unlink()
+
+    def _template(self, contents: str) -> Template:
+        """Get a compiled template, from memory if possible.
+
+        Args:
+            contents: Contents of the template.
+
+        Returns:
+            The compiled template.
+        """
+        template = self._templates.get(contents)
+        # the variables of the referenced templates may have changed
+        if template is None or template.get_references():
+            template = self._templates[contents] = Template(StringIO(contents))
+        self._templates.move_to_end(contents)
+        if len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+        return template
+
+    def _static(self):
+        """Get the static source, reloaded if the static file changed."""
+        static = self.obj["static"]
+        state = storage_state(static.static_file)
+        if state != self._static_state:
+            static.reload()
+            self._static_state = state
+        return static
+
+    def dispatch(self, request: dict) -> dict:
+        """Handle a request.
+
+        Args:
+            request: The request, its "command" key selects the handler.
+
+        Returns:
+            The response, with an "error" key if the request failed.
+        """
+        command = request.pop("command", None)
+        handler = getattr(self, f"_handle_{command}", None)
+        if handler is None:
+            return {"error": f'Unknown command "{command}".'}
+        try:
+            return handler(**request)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def _handle_list(self, pattern: Optional[str] = None) -> dict:
+        return {"items": [*self._static().list(pattern=pattern)]}
+
+    def _handle_add(self, variable_name: str, value: Any, force: bool = False) -> dict:
+        static = self._static()
+        try:
+            static.add(variable_name, value, force=force)
+        except ValueError:
+            return {"current": static.stored[variable_name]}
+        return {}
+
+    def _handle_run(
+        self,
+        template: str,
+        template_path: Optional[str],
+        destination_path: Optional[str],
+        run_cwd: str,
+        prompt: str = "always",
+        dry_run: bool = False,
+        answers: Optional[dict] = None,
+        skip_unchanged: bool = False,
+        preset: Optional[dict] = None,
+        search_path: Optional[List[str]] = None,
+    ) -> dict:
+        # the included templates stay compiled while the search path is the same
+        get_environment(search_path)
+        clinja_template = self._template(template)
+        static_vars = self._static().stored
+        dynamic_vars = self.obj["dynamic"].run(
+            static_vars=static_vars,
+            template=None if template_path is None else Path(template_path),
+            destination=None if destination_path is None else Path(destination_path),
+            run_cwd=Path(run_cwd),
+            variables=clinja_template.get_vars(),
+        )
+        all_vars = {**static_vars, **dynamic_vars}
+        # answers given in advance are never prompted for
+        preset = preset or {}
+
+        prompt_vars = get_prompt_vars(
+            clinja_template.get_vars() - preset.keys(), all_vars, prompt
+        )
+        if prompt == "never" and len(prompt_vars) > 0:
+            return {"error": f"Missing {', '.join(map(repr, sorted(prompt_vars)))}."}
+        if answers is None and len(prompt_vars) > 0:
+            # the client prompts and sends the answers in a new request
+            return {"prompt": [(var, all_vars.get(var)) for var in sorted(prompt_vars)]}
+        all_vars.update(preset)
+        all_vars.update(answers or {})
+
+        if destination_path is None:
+            output = StringIO()
+            clinja_template.dump(all_vars, output)
+            return {"output": output.getvalue()}
+        if dry_run:
+            return {}
+        written = clinja_template.dump_file(
+            all_vars, Path(destination_path), skip_unchanged=skip_unchanged
+        )
+        return {"written": written}
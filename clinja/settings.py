@@ -7,6 +7,25 @@ from click import get_app_dir
 CONF_DIR = Path(get_app_dir("clinja"))
 DYNAMIC_FILE = CONF_DIR / "dynamic.py"
 STATIC_FILE = CONF_DIR / "static.json"
+STATIC_DB_FILE = CONF_DIR / "static.db"
+SOCKET_FILE = CONF_DIR / "clinja.sock"
+CACHE_DIR = CONF_DIR / "cache"
+TEMPLATE_CACHE_DIR = CACHE_DIR / "templates"
+TEMPLATE_CACHE_MAX_SIZE = 50 * 1024**2
+DYNAMIC_CACHE_DIR = CACHE_DIR / "dynamic"
+DYNAMIC_CODE_CACHE_DIR = CACHE_DIR / "code"
+MANIFEST_FILE = CACHE_DIR / "manifest.json"
+# describes the templates of a precompiled template directory or zip file
+COMPILED_INFO_FILE = "clinja_templates.json"
+
+
+def get_static_file() -> Path:
+    """
+    Returns:
+        Path of the static file in use, once migrated the SQLite static file
+        takes precedence.
+    """
+    return STATIC_DB_FILE if STATIC_DB_FILE.is_file() else STATIC_FILE
 
 
 DYNAMIC_FILE_INIT = """\
@@ -22,6 +41,25 @@ DYNAMIC_FILE_INIT = """\
 # This file should populate the DYNAMIC_VARS dictionary:
 
 # DYNAMIC_VARS (dict): Dictionary of dynamic variables.
+
+# Expensive variables can instead be registered as providers, functions which
+# take no arguments and return the variable's value. Providers are only called
+# when the template uses their variable:
+
+# DYNAMIC_PROVIDERS (dict): Dictionary of variable names and providers.
+
+# When the dynamic results are cached, add any file read by this file to the
+# DYNAMIC_DEPENDS list, the cached results are invalidated when they change:
+
+# DYNAMIC_DEPENDS (list): List of paths on which the dynamic variables depend,
+# relative to this file's directory.
+
+# The results are reused within a clinja process while the inputs above and
+# the DYNAMIC_DEPENDS files are unchanged. Add the names of the variables whose
+# values change on every run, such as timestamps, to the DYNAMIC_VOLATILE list
+# to run this file again whenever the template uses them:
+
+# DYNAMIC_VOLATILE (list): List of variable names which are never reused.
 """
 
 STATIC_FILE_INIT = """\
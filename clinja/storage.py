@@ -0,0 +1,312 @@
+import json
+import os
+import re
+import stat
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # no advisory locking on windows
+    fcntl = None
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class JsonStorage:
+    def __init__(self, path: Path):
+        """Static storage in a json file, loaded in memory and rewritten on every
+        change.
+
+        Changes are applied to the latest contents of the file while holding an
+        advisory lock, then written to a temporary file which replaces the json
+        file. Concurrent writers don't lose each other's changes and readers
+        never see a partially written file.
+
+        Args:
+            path: Path of the json file.
+
+        Attributes:
+            lock_path: Path of the lock file.
+        """
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(f".{self.path.name}.lock")
+        self._data = None
+
+    def load(self) -> dict:
+        """
+        Returns:
+            Stored variable names and values.
+        """
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    def _read(self) -> dict:
+        with open(self.path, "r") as fp:
+            return json.load(fp)
+
+    def reload(self):
+        """Discard the loaded values, they are read from file on next access."""
+        self._data = None
+
+    @contextmanager
+    def _lock(self):
+        """Hold the advisory write lock."""
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open(self.lock_path, "a") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _write(self, data: dict):
+        """Atomically replace the json file.
+
+        Args:
+            data: Variable names and values to write.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(data, fp, indent=4, sort_keys=True)
+                fp.flush()
+                os.fsync(fp.fileno())
+            if self.path.exists():
+                os.chmod(tmp_path, stat.S_IMODE(self.path.stat().st_mode))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _modify(self, func: Callable[[dict], Any]) -> Any:
+        """Apply a change to the latest stored values and write them.
+
+        Args:
+            func: Function modifying the values in place, if it raises nothing is
+                written.
+
+        Returns:
+            The return value of `func`.
+        """
+        with self._lock():
+            data = self._read()
+            out = func(data)
+            self._write(data)
+        self._data = data
+        return out
+
+    def keys(self) -> List[str]:
+        """
+        Returns:
+            Stored variable names.
+        """
+        return [*self.load().keys()]
+
+    def get(self, name: str) -> Any:
+        """Get a stored value.
+
+        Args:
+            name: Variable name.
+
+        Returns:
+            The stored value.
+
+        Raises:
+            KeyError: if `name` is not stored.
+        """
+        return self.load()[name]
+
+    def items(self, pattern: Optional[str] = None) -> Iterable[Tuple[str, Any]]:
+        """
+        Args:
+            pattern: Regex pattern for variable name filtering.
+
+        Returns:
+            Iterable on the stored variable names and values.
+        """
+        if pattern is None:
+            return self.load().items()
+        pattern = re.compile(pattern)
+        return ((k, v) for k, v in self.load().items() if re.search(pattern, k))
+
+    def set(self, name: str, value: Any):
+        """Store a value.
+
+        Args:
+            name: Variable name.
+            value: Value to store.
+        """
+        self._modify(lambda data: data.__setitem__(name, value))
+
+    def update(self, values: dict):
+        """Store many values at once.
+
+        Args:
+            values: Variable names and values to store.
+        """
+        self._modify(lambda data: data.update(values))
+
+    def delete(self, name: str):
+        """Remove a stored value.
+
+        Args:
+            name: Variable name.
+
+        Raises:
+            KeyError: if `name` is not stored.
+        """
+        self._modify(lambda data: data.__delitem__(name))
+
+    def delete_many(self, names: Iterable[str]) -> List[str]:
+        """Remove many stored values at once.
+
+        Args:
+            names: Variable names.
+
+        Returns:
+            The variable names which were not stored.
+        """
+        names = [*names]
+
+        def delete(data):
+            missing = [name for name in names if name not in data]
+            for name in names:
+                data.pop(name, None)
+            return missing
+
+        return self._modify(delete)
+
+
+class SqliteStorage:
+    def __init__(self, path: Path):
+        """Static storage in an SQLite database, with point lookups and single row
+        updates.
+
+        Args:
+            path: Path of the database file, created if missing.
+        """
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+
+            self._conn = sqlite3.connect(str(self.path), timeout=30)
+            # readers don't block on writers
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.create_function(
+                "REGEXP", 2, lambda pattern, name: re.search(pattern, name) is not None
+            )
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS static "
+                    "(name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+        return self._conn
+
+    def load(self) -> dict:
+        return dict(self.items())
+
+    def reload(self):
+        # reads always hit the database
+        pass
+
+    def keys(self) -> List[str]:
+        return [
+            r[0] for r in self.conn.execute("SELECT name FROM static ORDER BY name")
+        ]
+
+    def get(self, name: str) -> Any:
+        row = self.conn.execute(
+            "SELECT value FROM static WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def items(self, pattern: Optional[str] = None) -> Iterable[Tuple[str, Any]]:
+        if pattern is None:
+            rows = self.conn.execute("SELECT name, value FROM static ORDER BY name")
+        else:
+            rows = self.conn.execute(
+                "SELECT name, value FROM static WHERE name REGEXP ? ORDER BY name",
+                (pattern,),
+            )
+        return [(name, json.loads(value)) for name, value in rows]
+
+    def set(self, name: str, value: Any):
+        self.update({name: value})
+
+    def update(self, values: dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO static (name, value) VALUES (?, ?)",
+                ((k, json.dumps(v)) for k, v in values.items()),
+            )
+
+    def delete(self, name: str):
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM static WHERE name = ?", (name,))
+        if cursor.rowcount == 0:
+            raise KeyError(name)
+
+    def delete_many(self, names: Iterable[str]) -> List[str]:
+        missing = []
+        with self.conn:
+            for name in names:
+                cursor = self.conn.execute("DELETE FROM static WHERE name = ?", (name,))
+                if cursor.rowcount == 0:
+                    missing.append(name)
+        return missing
+
+
+def storage_state(path: Path) -> str:
+    """Get the state of a static storage file, which changes with every write.
+
+    SQLite databases in WAL mode are written to their "-wal" file, the main file
+    is only updated on checkpoints, the state then includes the "-wal" file.
+
+    Args:
+        path: Path of the storage file.
+
+    Returns:
+        The modification times and sizes of the storage's files.
+
+    Raises:
+        OSError: if the storage file can't be accessed.
+    """
+    stat = os.stat(path)
+    state = f"{stat.st_mtime_ns} {stat.st_size}"
+    if Path(path).suffix in SQLITE_SUFFIXES:
+        try:
+            stat = os.stat(f"{path}-wal")
+            state += f" {stat.st_mtime_ns} {stat.st_size}"
+        except FileNotFoundError:
+            pass
+    return state
+
+
+def open_storage(path: Path):
+    """Open a static storage, the backend depends on the file extension.
+
+    Args:
+        path: Path of the storage file.
+
+    Returns:
+        SqliteStorage for ".db", ".sqlite" and ".sqlite3" files, JsonStorage
+        otherwise.
+    """
+    if Path(path).suffix in SQLITE_SUFFIXES:
+        return SqliteStorage(path)
+    return JsonStorage(path)
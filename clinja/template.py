@@ -0,0 +1,410 @@
+import json
+import time
+from functools import lru_cache
+from io import TextIOWrapper
+from pathlib import Path
+from types import CodeType
+from typing import IO, Iterable, List, Optional, Tuple
+from zipfile import BadZipFile, ZipFile
+
+from jinja2 import Environment, FileSystemLoader, ModuleLoader, Template, nodes
+from jinja2.meta import find_referenced_templates, find_undeclared_variables
+
+from . import profiling
+from .cache import TemplateCache
+from .manifest import Manifest, digest
+from .settings import COMPILED_INFO_FILE
+from .utils import write_atomic
+
+# number of included or imported templates kept compiled by the environment
+CACHE_SIZE = 400
+
+# created on first use, shared by all the templates of the process
+_ENVIRONMENT = None
+
+
+def get_environment(search_path: Optional[Iterable[Path]] = None) -> Environment:
+    """Get the process wide jinja environment.
+
+    Included and imported templates are looked up in the search path, compiled
+    once and kept in the environment's LRU cache, they are recompiled when their
+    file changes.
+
+    Args:
+        search_path: Directories in which included and imported templates are
+            looked up, in order. If provided, replaces the current search path.
+
+    Returns:
+        The jinja environment used by default to compile the templates.
+    """
+    global _ENVIRONMENT
+    if _ENVIRONMENT is None:
+        _ENVIRONMENT = Environment(
+            loader=FileSystemLoader([]), cache_size=CACHE_SIZE, auto_reload=True
+        )
+    if search_path is not None:
+        search_path = [str(path) for path in search_path]
+        # the cached templates are bound to their loader, keep it if possible
+        if search_path != _ENVIRONMENT.loader.searchpath:
+            _ENVIRONMENT.loader = FileSystemLoader(search_path)
+    return _ENVIRONMENT
+
+
+def _assigned_variables(ast: nodes.Template) -> set:
+    """
+    Args:
+        ast: Parsed template.
+
+    Returns:
+        The names the template assigns, with set tags, loops, macros or imports.
+    """
+    return {
+        node.name for node in ast.find_all(nodes.Name) if node.ctx in ("store", "param")
+    }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _source_info(environment: Environment, source: str) -> Tuple[set, set, list]:
+    """Parse a referenced template, once per source.
+
+    Args:
+        environment: jinja environment used to parse the template.
+        source: Source of the template.
+
+    Returns:
+        The undeclared variables, assigned variables and referenced templates
+        of the template.
+    """
+    ast = environment.parse(source)
+    return (
+        find_undeclared_variables(ast),
+        _assigned_variables(ast),
+        [*find_referenced_templates(ast)],
+    )
+
+
+def find_referenced_variables(
+    environment: Environment, references: Iterable[Optional[str]]
+) -> Tuple[set, set, dict]:
+    """Find the variables of the templates included, imported or extended by a
+    template, recursively.
+
+    Args:
+        environment: jinja environment whose loader resolves the templates.
+        references: Names of the referenced templates, None for names only
+            known at render time.
+
+    Returns:
+        The undeclared variables and the assigned variables of the referenced
+        templates, and the hex digest of each referenced template's source, None
+        for the missing templates.
+    """
+    variables = set()
+    assigned = set()
+    digests = {}
+    pending = [name for name in references if name is not None]
+    while pending:
+        name = pending.pop()
+        if name in digests:
+            continue
+        try:
+            source = environment.loader.get_source(environment, name)[0]
+        except Exception:
+            # a missing template fails the render, it has no variables
+            digests[name] = None
+            continue
+        digests[name] = digest(source)
+        undeclared, stored, nested = _source_info(environment, source)
+        variables |= undeclared
+        assigned |= stored
+        pending.extend(name for name in nested if name is not None)
+    return variables, assigned, digests
+
+
+def find_variables(environment: Environment, ast: nodes.Template) -> Tuple[set, dict]:
+    """Find the undeclared variables of a template, including the ones of the
+    templates it includes, imports or extends.
+
+    The variables of the referenced templates assigned by the template, e.g. loop
+    variables, are not undeclared.
+
+    Args:
+        environment: jinja environment whose loader resolves the referenced
+            templates.
+        ast: Parsed template.
+
+    Returns:
+        The undeclared variables, and the hex digest of each referenced
+        template's source.
+    """
+    variables, assigned, digests = find_referenced_variables(
+        environment, find_referenced_templates(ast)
+    )
+    assigned |= _assigned_variables(ast)
+    return find_undeclared_variables(ast) | (variables - assigned), digests
+
+
+def compile_template(
+    contents: str, environment: Environment, cache: Optional[TemplateCache] = None
+) -> Tuple[set, CodeType, List[Optional[str]]]:
+    """Parse and compile a template, skipping both for cached templates.
+
+    Args:
+        contents: Contents of the template.
+        environment: jinja environment used to compile the template.
+        cache: Compiled template cache.
+
+    Returns:
+        The undeclared variables, compiled code and referenced templates of the
+        template.
+    """
+    cached = None
+    if cache is not None:
+        with profiling.phase("cache"):
+            cached = cache.get(contents)
+        if cached is not None and cached[3]:
+            # the variables of the referenced templates must be current
+            with profiling.phase("parse"):
+                digests = find_referenced_variables(environment, cached[2])[2]
+            if digests != cached[3]:
+                cached = None
+    if cached is None:
+        # parse once, the ast is used for both compilation and variable
+        # discovery
+        with profiling.phase("parse"):
+            ast = environment.parse(contents)
+            variables, digests = find_variables(environment, ast)
+            references = [*find_referenced_templates(ast)]
+        with profiling.phase("compile"):
+            code = environment.compile(ast)
+        if cache is not None:
+            with profiling.phase("cache"):
+                cache.set(contents, variables, code, references, digests)
+    else:
+        variables, code, references, _ = cached
+    return variables, code, references
+
+
+class Template(Template):
+    """Small wrapper to cleanly provide the template in the form of a
+    TextIOWrapper object.
+    """
+
+    def __new__(
+        cls,
+        template: TextIOWrapper,
+        environment: Environment = None,
+        cache: TemplateCache = None,
+    ):
+        """
+        Args:
+            template: Template TextIOWrapper object.
+            environment: jinja environment used to compile the template, the
+                shared environment by default.
+            cache: Compiled template cache, if provided compilation is skipped
+                for cached templates.
+
+        Attributes:
+            contents: Contents of the template
+            vars: Undeclared variables of the template and of the templates
+                it includes, imports or extends.
+            references: Names of the templates it includes or imports, None for
+                names only known at render time.
+        """
+        if environment is None:
+            environment = get_environment()
+        with profiling.phase("read"):
+            contents = template.read()
+        variables, code, references = compile_template(contents, environment, cache)
+        with profiling.phase("compile"):
+            template_cls = cls.from_code(
+                environment, code, environment.make_globals(None)
+            )
+        template_cls._contents = contents
+        template_cls._digest = None
+        template_cls._vars = variables
+        template_cls._references = references
+        return template_cls
+
+    @classmethod
+    def from_compiled(cls, compiled: "CompiledTemplates", name: str) -> "Template":
+        """Load a template compiled ahead of time, without parsing or compiling
+        it.
+
+        Args:
+            compiled: Compiled template set holding the template.
+            name: Name of the template, its path relative to the compiled
+                template directory.
+
+        Returns:
+            The template.
+
+        Raises:
+            KeyError: if the compiled template set has no such template.
+        """
+        info = compiled.infos[name]
+        with profiling.phase("load"):
+            # the compiled environment loads the templates as instances of
+            # this class
+            template = compiled.environment.get_template(name)
+        template._contents = None
+        template._digest = info["digest"]
+        template._vars = set(info["variables"])
+        template._references = info["references"]
+        return template
+
+    def dump(self, variables: dict, fp: IO, buffer_size: int = 1):
+        """Render the template to a file object, chunk by chunk, without holding
+        the whole output in memory.
+
+        Args:
+            variables: Variable names and values.
+            fp: File object to write to.
+            buffer_size: Number of rendered chunks to buffer before each write.
+        """
+        stream = self.stream(variables)
+        if buffer_size > 1:
+            stream.enable_buffering(buffer_size)
+        if not profiling.enabled():
+            stream.dump(fp)
+            return
+        # rendering happens lazily between the writes
+        writer = profiling.TimedWriter(fp)
+        start = time.perf_counter()
+        stream.dump(writer)
+        profiling.add("write", writer.seconds)
+        profiling.add("render", time.perf_counter() - start - writer.seconds)
+
+    def dump_file(
+        self,
+        variables: dict,
+        path: Path,
+        buffer_size: int = 1,
+        skip_unchanged: bool = False,
+    ) -> bool:
+        """Render the template to a file, creating its parent directories.
+
+        Args:
+            variables: Variable names and values.
+            path: Path of the file to write.
+            buffer_size: Number of rendered chunks to buffer before each write.
+            skip_unchanged: Leave the file untouched if the rendered contents
+                are identical to the existing contents.
+
+        Returns:
+            Whether the file was written.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # a failing render leaves the previous file untouched
+        return write_atomic(
+            path,
+            lambda fp: self.dump(variables, fp, buffer_size=buffer_size),
+            skip_unchanged=skip_unchanged,
+        )
+
+    def get_vars(self) -> set:
+        """Gets the variables in the template.
+
+        Returns:
+            Set containing the undeclared variables found in the template.
+        """
+        return self._vars
+
+    def get_references(self) -> List[Optional[str]]:
+        """Gets the templates included or imported by the template.
+
+        Returns:
+            List of the referenced template names, None for names only known at
+            render time.
+        """
+        return self._references
+
+    def get_digest(self) -> str:
+        """
+        Returns:
+            Hex digest of the template's contents.
+        """
+        if self._digest is None:
+            self._digest = digest(self._contents)
+        return self._digest
+
+
+def compile_templates(template_dir: Path, target: Path, zip: bool = False) -> int:
+    """Compile the templates of a directory ahead of time, to python modules.
+
+    The variables, references and digest of each template are written along
+    with the modules, running the compiled templates then requires neither
+    their sources nor parsing them.
+
+    Args:
+        template_dir: Root of the template tree.
+        target: Directory, or zip file, to write the compiled templates to.
+        zip: Write the compiled templates to a zip file.
+
+    Returns:
+        The number of compiled templates.
+
+    Raises:
+        jinja2.TemplateSyntaxError: if a template fails to compile.
+    """
+    environment = Environment(loader=FileSystemLoader(str(template_dir)))
+    # only used to hash the referenced templates
+    manifest = Manifest(manifest_file=None)
+    infos = {}
+    for name in environment.list_templates():
+        source = environment.loader.get_source(environment, name)[0]
+        ast = environment.parse(source, name)
+        references = [*find_referenced_templates(ast)]
+        infos[name] = {
+            "variables": sorted(find_variables(environment, ast)[0]),
+            "references": references,
+            "digest": digest(source),
+            "includes": manifest.include_digests(environment, references),
+        }
+    environment.compile_templates(
+        str(target), zip="deflated" if zip else None, ignore_errors=False
+    )
+    if zip:
+        with ZipFile(target, "a") as zip_file:
+            zip_file.writestr(COMPILED_INFO_FILE, json.dumps(infos))
+    else:
+        (target / COMPILED_INFO_FILE).write_text(json.dumps(infos))
+    return len(infos)
+
+
+class CompiledTemplates:
+    def __init__(self, path: Path):
+        """Templates compiled ahead of time by `compile_templates`.
+
+        Args:
+            path: Directory or zip file of the compiled templates.
+
+        Attributes:
+            environment: jinja environment loading the compiled templates.
+            infos: Variables, references, digest and digests of the referenced
+                templates of each template, by name.
+
+        Raises:
+            ValueError: if the path doesn't hold compiled templates.
+        """
+        self.path = path
+        try:
+            if path.is_dir():
+                contents = (path / COMPILED_INFO_FILE).read_text()
+            else:
+                with ZipFile(path) as zip_file:
+                    contents = zip_file.read(COMPILED_INFO_FILE).decode("utf8")
+            self.infos = json.loads(contents)
+        except (OSError, KeyError, ValueError, BadZipFile):
+            raise ValueError(f"{path} doesn't hold compiled templates.")
+        self.environment = Environment(
+            loader=ModuleLoader(str(path)), cache_size=CACHE_SIZE, auto_reload=False
+        )
+        self.environment.template_class = Template
+
+    def names(self) -> List[str]:
+        """
+        Returns:
+            The names of the compiled templates, sorted.
+        """
+        return sorted(self.infos)
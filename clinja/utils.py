@@ -1,13 +1,17 @@
+import json
 import os
+import stat
 import sys
 from ast import literal_eval
 from functools import partial, update_wrapper, wraps
-from io import TextIOWrapper
-from typing import Any, Callable, Optional
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, Optional, Tuple
 
 import click
-from jinja2 import Template
-from jinja2.meta import find_undeclared_variables
+
+from .settings import COMPILED_INFO_FILE
+
+STDIO = Path("-")
 
 
 def partial_wrap(func: Callable, *args, **kwargs) -> Callable:
@@ -52,6 +56,169 @@ def literal_eval_or_string(value: str) -> Any:
         return value
 
 
+def parse_env(contents: str) -> dict:
+    """Parse the contents of a .env file.
+
+    Args:
+        contents: Lines of KEY=VALUE pairs, optionally prefixed with "export".
+            Empty lines and lines starting with "#" are ignored.
+
+    Returns:
+        The variable names and values, values are evaled if possible.
+    """
+    values = {}
+    for line in contents.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("export "):
+            line = line[len("export ") :]
+        if "=" not in line:
+            raise ValueError(f'"{line}" is not a KEY=VALUE pair.')
+        key, value = line.split("=", 1)
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        values[key.strip()] = literal_eval_or_string(value)
+    return values
+
+
+def load_variables(fp: IO, fmt: str = "json") -> dict:
+    """Load variable names and values from a file.
+
+    Args:
+        fp: File object to read.
+        fmt: Format of the file, "json", "yaml" or "env".
+
+    Returns:
+        The variable names and values.
+
+    Raises:
+        ValueError: if the file doesn't contain a mapping of variable names
+            to values.
+        ImportError: if the format is "yaml" and PyYAML is not installed.
+    """
+    contents = fp.read()
+    if fmt == "env":
+        values = parse_env(contents)
+    elif fmt == "yaml":
+        import yaml
+
+        try:
+            values = yaml.safe_load(contents)
+        except yaml.YAMLError as e:
+            raise ValueError(str(e))
+    else:
+        values = json.loads(contents)
+    if not isinstance(values, dict):
+        raise ValueError("The file should contain a mapping of names to values.")
+    return values
+
+
+def read_records(path: Path) -> Iterator[dict]:
+    """Lazily read records from a JSONL or CSV file.
+
+    Args:
+        path: Path of the file, "-" for stdin. Files with a ".csv" suffix are read
+            as CSV with a header row, their values are strings. Other files are
+            read as JSONL, one object per line.
+
+    Returns:
+        Iterator on the records.
+
+    Raises:
+        ValueError: if the file is malformed or a JSONL line isn't an object.
+    """
+    with click.open_file(str(path), "r") as fp:
+        if path.suffix == ".csv":
+            import csv
+
+            try:
+                yield from csv.DictReader(fp)
+            except csv.Error as e:
+                raise ValueError(str(e))
+            return
+        for line_number, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line_number} is not a JSON object.")
+            yield record
+
+
+def write_atomic(
+    path: Path, write: Callable[[IO], Any], skip_unchanged: bool = False
+) -> bool:
+    """Write a file through a temporary file, so that it is never partially
+    written.
+
+    The contents are written to a temporary file next to `path`, which then
+    replaces it. If writing fails, `path` is left untouched. Paths which aren't
+    regular files, e.g. /dev/stdout, are written directly. If the directory
+    isn't writable, the contents are written to memory, then to `path` in
+    place.
+
+    Args:
+        path: Path of the file to write.
+        write: Function writing the contents to a file object.
+        skip_unchanged: Leave the file untouched when its contents wouldn't
+            change.
+
+    Returns:
+        Whether the file was written.
+    """
+    import filecmp
+    import tempfile
+    from io import StringIO
+
+    # write through symlinks, to their target
+    path = Path(os.path.realpath(path))
+    if path.exists() and not path.is_file():
+        with open(path, "w") as fp:
+            write(fp)
+        return True
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+    except PermissionError:
+        buffer = StringIO()
+        write(buffer)
+        contents = buffer.getvalue()
+        if skip_unchanged and path.is_file():
+            with open(path, "r") as fp:
+                if fp.read() == contents:
+                    return False
+        with open(path, "w") as fp:
+            fp.write(contents)
+        return True
+    try:
+        with os.fdopen(fd, "w") as fp:
+            write(fp)
+        if (
+            skip_unchanged
+            and path.is_file()
+            and filecmp.cmp(tmp_path, path, shallow=False)
+        ):
+            os.unlink(tmp_path)
+            return False
+        if path.exists():
+            mode = stat.S_IMODE(path.stat().st_mode)
+        else:
+            # temporary files are private, use the default file mode
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
 def sanitize_variable_name(variable_name: str) -> str:
     variable_name = variable_name.strip()
     if variable_name.isidentifier():
@@ -60,6 +227,86 @@ def sanitize_variable_name(variable_name: str) -> str:
         raise ValueError(f'"{variable_name}" is not a valid variable name.')
 
 
+def io_path(path: Path) -> Optional[Path]:
+    """Map the "-" stdin/stdout path to None.
+
+    Args:
+        path: Path provided on the command line.
+
+    Returns:
+        The path, or None when it refers to stdin/stdout.
+    """
+    if path == STDIO:
+        return None
+    return path
+
+
+def is_compiled(path: Path) -> bool:
+    """Check if a path holds templates precompiled by `clinja compile`.
+
+    Args:
+        path: Path provided on the command line.
+
+    Returns:
+        Whether the path is a compiled template directory or zip file.
+    """
+    if path.is_dir():
+        return (path / COMPILED_INFO_FILE).is_file()
+    if path == STDIO or not path.is_file():
+        return False
+    import zipfile
+
+    return zipfile.is_zipfile(path)
+
+
+def get_prompt_vars(template_vars: set, known_vars: Iterable, prompt: str) -> set:
+    """Find the variables to prompt for.
+
+    Args:
+        template_vars: Variables used by the template(s).
+        known_vars: Variables with a value.
+        prompt: When to prompt, "always", "missing" or "never".
+
+    Returns:
+        The variables to prompt for, for "never" these are the missing variables.
+    """
+    if prompt == "missing" or prompt == "never":
+        return template_vars - set(known_vars)
+    return set(template_vars)
+
+
+def guess_format(path: Path) -> str:
+    """Guess the format of a variables file from its name.
+
+    Args:
+        path: Path of the file, "-" for stdin.
+
+    Returns:
+        "yaml" or "env" for files with such extensions, "json" otherwise.
+    """
+    if path.name == ".env":
+        return "env"
+    suffix = path.suffix.lower()
+    return {".yaml": "yaml", ".yml": "yaml", ".env": "env"}.get(suffix, "json")
+
+
+def walk_templates(
+    template_dir: Path, destination_dir: Path
+) -> Iterator[Tuple[Path, Path]]:
+    """Walk a template directory tree.
+
+    Args:
+        template_dir: Root of the template tree.
+        destination_dir: Root of the output tree.
+
+    Returns:
+        Iterator on (template, destination) path pairs, sorted by template path.
+    """
+    for template in sorted(template_dir.rglob("*")):
+        if template.is_file():
+            yield template, destination_dir / template.relative_to(template_dir)
+
+
 def f_docstring(docstring: str) -> Callable:
     """Bypass for f formatted docstrings."""
 
@@ -79,6 +326,21 @@ def bold(string: str) -> str:
     return click.style(string, bold=True)
 
 
+# the terminal, opened on the first prompt and shared by the following ones
+_TTY = None
+
+
+def _tty() -> IO:
+    """
+    Returns:
+        The line buffered, utf8 decoded, terminal.
+    """
+    global _TTY
+    if _TTY is None:
+        _TTY = open("/dev/tty", "r", encoding="utf8", errors="replace")
+    return _TTY
+
+
 def prompt_tty(
     string: str,
     default: Optional[str],
@@ -86,21 +348,16 @@ def prompt_tty(
     prompt_suffix: str = ": ",
     value_proc: Optional[Callable] = None,
 ) -> str:
-    tty = os.open("/dev/tty", os.O_RDONLY)
     prompt_str = string
     if default and show_default:
         prompt_str += f" [{default}]"
     prompt_str += prompt_suffix
     click.echo(prompt_str, err=True, nl=False)
 
-    user_input = ""
-    while True:
-        raw = os.read(tty, 1).decode("utf8")
-        if not raw or raw == "\n":  # Wait for Ctrl-D or empty line
-            break
-        user_input += raw
-
-    os.close(tty)
+    # wait for an empty line or Ctrl-D
+    user_input = _tty().readline()
+    if user_input.endswith("\n"):
+        user_input = user_input[:-1]
     if not user_input and default is not None:
         return default
     if value_proc is not None:
@@ -125,30 +382,18 @@ class AliasedGroup(click.Group):
         ctx.fail("Too many matches: %s" % ", ".join(sorted(matches)))
 
 
-class Template(Template):
-    """Small wrapper to cleanly provide the template in the form of a
-    TextIOWrapper object.
-    """
-
-    def __new__(cls, template: TextIOWrapper, *args, **kwargs):
-        """
-        Args:
-            template: Template TextIOWrapper object.
-
-        Attributes:
-            contents: Contents of the template
+if sys.version_info >= (3, 7):
 
-        """
-        contents = template.read()
-        template_cls = super().__new__(cls, contents, *args, **kwargs)
-        template_cls._contents = contents
-        return template_cls
+    def __getattr__(name: str) -> Any:
+        # Template lives in its own module, to avoid importing jinja when it
+        # isn't needed.
+        if name == "Template":
+            from .template import Template
 
-    def get_vars(self) -> set:
-        """Gets the variables in the template.
+            return Template
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        Returns:
-            Set containing the undeclared variables found in the template.
-        """
-        ast = self.environment.parse(self._contents)
-        return find_undeclared_variables(ast)
+else:  # pragma: no cover
+    # no module __getattr__, the package imports this module before the
+    # template module
+    from .template import Template  # noqa: F401
@@ -0,0 +1,223 @@
+import os
+import select
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# inotify events signaling a change of a directory's entries
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+
+
+class _Inotify:
+    def __init__(self):
+        """Minimal inotify bindings, used to sleep until a watched directory
+        changes.
+
+        Raises:
+            OSError: if inotify is not available.
+        """
+        import ctypes
+
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            init = self._libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available.")
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        self._watched = set()
+
+    def watch(self, directory: Path):
+        if directory in self._watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_MASK) >= 0:
+            self._watched.add(directory)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """Wait for events.
+
+        Args:
+            timeout: Maximum waiting time, in seconds. If None, wait
+                indefinitely.
+
+        Returns:
+            Whether events occurred.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # the events themselves are not needed, the changes are found by
+        # comparing the file states
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    def __init__(
+        self,
+        paths: Iterable[Path],
+        interval: float = 0.02,
+        debounce: float = 0.02,
+        use_inotify: bool = True,
+    ):
+        """Watch files and directory trees for changes.
+
+        Uses inotify where available, polling otherwise. In both cases the
+        changes are found by comparing the modification time and size of the
+        watched files.
+
+        Args:
+            paths: Files and directories to watch, directories are watched
+                recursively. The paths don't need to exist.
+            interval: Polling interval, in seconds.
+            debounce: Time without changes to wait for, after a change, before
+                reporting it, in seconds.
+            use_inotify: Use inotify if available.
+
+        Attributes:
+            inotify: Whether inotify is used.
+        """
+        self.interval = interval
+        self.debounce = debounce
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except OSError:
+                pass
+        self.inotify = self._inotify is not None
+        self.set_paths(paths)
+
+    def set_paths(self, paths: Iterable[Path]):
+        """Change the watched paths, their current state is the reference for
+        the next changes.
+
+        Args:
+            paths: Files and directories to watch.
+        """
+        self.paths = sorted({Path(p).absolute() for p in paths})
+        self._states = self._snapshot()
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        """
+        Returns:
+            The modification time and size of the watched files.
+        """
+        states = {}
+        for path in self.paths:
+            if path.is_dir():
+                if self._inotify is not None:
+                    self._inotify.watch(path)
+                for root, dirs, files in os.walk(path):
+                    if self._inotify is not None:
+                        for d in dirs:
+                            self._inotify.watch(Path(root) / d)
+                    for f in files:
+                        self._stat(Path(root) / f, states)
+            else:
+                if self._inotify is not None:
+                    # watch the directory, files replaced by a rename keep
+                    # being watched
+                    self._inotify.watch(path.parent)
+                self._stat(path, states)
+        return states
+
+    @staticmethod
+    def _stat(path: Path, states: dict):
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        states[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def _sleep(self, timeout: Optional[float]) -> bool:
+        """Sleep until the next check.
+
+        Args:
+            timeout: Maximum sleeping time with inotify, in seconds. If None,
+                sleep until an event occurs.
+
+        Returns:
+            Whether a change might have occurred.
+        """
+        if self._inotify is not None:
+            return self._inotify.wait(timeout)
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return True
+
+    def _changes(self) -> Set[Path]:
+        states = self._snapshot()
+        changed = {
+            p
+            for p in states.keys() | self._states.keys()
+            if states.get(p) != self._states.get(p)
+        }
+        self._states = states
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Wait for changes of the watched files.
+
+        Args:
+            timeout: Maximum waiting time, in seconds. If None, wait until a
+                change occurs.
+
+        Returns:
+            The changed, created or removed files, empty if the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+            if self._sleep(remaining):
+                changed = self._changes()
+        # wait for the writes to settle, editors often write files in several
+        # steps
+        while True:
+            if self._inotify is not None:
+                if not self._inotify.wait(self.debounce):
+                    return changed
+            else:
+                time.sleep(self.debounce)
+            more = self._changes()
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
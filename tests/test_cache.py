@@ -0,0 +1,62 @@
+from io import StringIO
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase
+
+from jinja2 import DictLoader, Environment
+
+from clinja.cache import TemplateCache
+from clinja.utils import Template
+
+
+class TestTemplateCache(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_cache")
+        self.cache = TemplateCache(cache_dir=self.test_dir)
+        self.contents = "{{ var1 }} {% for f in var2 %}{{ f }}{% endfor %}"
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get(self.contents))
+        template = Template(StringIO(self.contents), cache=self.cache)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+        variables, code, references, digests = self.cache.get(self.contents)
+        self.assertEqual(variables, {"var1", "var2"})
+        self.assertEqual(references, [])
+        self.assertEqual(digests, {})
+        cached = Template(StringIO(self.contents), cache=self.cache)
+        self.assertEqual(cached.get_vars(), template.get_vars())
+        self.assertEqual(
+            cached.render(var1="a", var2=[1, 2]), template.render(var1="a", var2=[1, 2])
+        )
+
+    def test_references(self):
+        environment = Environment(loader=DictLoader({"partial": "{{ var3 }}"}))
+        contents = '{{ var1 }} {% include "partial" %}'
+        template = Template(StringIO(contents), environment=environment, cache=self.cache)
+        self.assertEqual(template.get_vars(), {"var1", "var3"})
+        cached = Template(StringIO(contents), environment=environment, cache=self.cache)
+        self.assertEqual(cached.get_vars(), {"var1", "var3"})
+
+        # the entry is stale once a referenced template changes
+        environment.loader.mapping["partial"] = "{{ var4 }}"
+        template = Template(StringIO(contents), environment=environment, cache=self.cache)
+        self.assertEqual(template.get_vars(), {"var1", "var4"})
+        self.assertEqual(self.cache.get(contents)[0], {"var1", "var4"})
+
+    def test_evict(self):
+        Template(StringIO(self.contents), cache=self.cache)
+        self.cache.max_size = self.cache.stats()["size"]
+        Template(StringIO("{{ other }}"), cache=self.cache)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.assertIsNone(self.cache.get(self.contents))
+        self.assertIsNotNone(self.cache.get("{{ other }}"))
+
+    def test_clear(self):
+        self.assertEqual(self.cache.clear(), 0)
+        Template(StringIO(self.contents), cache=self.cache)
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def tearDown(self):
+        rmtree(self.test_dir, ignore_errors=True)
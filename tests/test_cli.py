@@ -1,8 +1,16 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
 import click
 import clinja
 from pathlib import Path
 from shutil import rmtree
+from multiprocessing import Pool
 from unittest import TestCase
+from unittest.mock import patch
 from clinja import cli
 from click.testing import CliRunner
 
@@ -25,6 +33,108 @@ class TestPromptChecks(TestCase):
             cli.prompt_variable_name_check("1")
 
 
+class TestImports(TestCase):
+    def test_lazy_imports(self):
+        # the cli shouldn't import the rendering dependencies up front
+        code = (
+            "import sys; import clinja.cli; "
+            "print(any(m in sys.modules for m in ['jinja2', 'myopy', 'asyncio']))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            check=True,
+            cwd=Path(clinja.__file__).parent.parent,
+        )
+        self.assertEqual(out.stdout.strip(), b"False")
+
+
+class TestWatch(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_cli_watch").resolve()
+        (self.test_dir / "templates").mkdir(parents=True, exist_ok=True)
+        self.env = {
+            **os.environ,
+            "XDG_CONFIG_HOME": str(self.test_dir / "config"),
+            "PYTHONPATH": str(Path(clinja.__file__).parent.parent),
+        }
+
+    def clinja(self, *args, **kwargs):
+        return subprocess.Popen(
+            [sys.executable, "-c", "from clinja.cli import cli; cli()", *args],
+            env=self.env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **kwargs,
+        )
+
+    def wait_for(self, path, contents):
+        start = time.monotonic()
+        while time.monotonic() - start < 10:
+            if path.exists() and path.read_text() == contents:
+                return
+            time.sleep(0.01)
+        self.fail(f"{path} was not rendered.")
+
+    def test_watch(self):
+        templates = self.test_dir / "templates"
+        (templates / "a").write_text("{{ aa }}")
+        (templates / "b").write_text("{{ bb }}")
+        destination = self.test_dir / "out"
+        self.clinja("add", "aa", "1").wait()
+        self.clinja("add", "bb", "2").wait()
+
+        watch = self.clinja(
+            "run", str(templates), str(destination), "--prompt", "never", "--watch"
+        )
+        try:
+            self.wait_for(destination / "b", "2")
+            (templates / "a").write_text("{{ aa }}!")
+            self.wait_for(destination / "a", "1!")
+            mtime = (destination / "a").stat().st_mtime_ns
+            self.clinja("add", "bb", "3", "-f").wait()
+            self.wait_for(destination / "b", "3")
+            self.assertEqual((destination / "a").stat().st_mtime_ns, mtime)
+        finally:
+            watch.terminate()
+            watch.wait()
+
+    def test_watch_include(self):
+        templates = self.test_dir / "templates"
+        (templates / "a").write_text('{% include "partial" %}')
+        partials = self.test_dir / "partials"
+        partials.mkdir(exist_ok=True)
+        (partials / "partial").write_text("{{ aa }}")
+        destination = self.test_dir / "out"
+        self.clinja("add", "aa", "1").wait()
+        (self.test_dir / "config" / "clinja" / "dynamic.py").write_text(
+            "DYNAMIC_PROVIDERS['cc'] = lambda: 'provided'\n"
+        )
+
+        watch = self.clinja(
+            "run",
+            str(templates),
+            str(destination),
+            "-I",
+            str(partials),
+            "--prompt",
+            "never",
+            "--watch",
+        )
+        try:
+            self.wait_for(destination / "a", "1")
+            # the provider of the variable the partial now uses is called
+            (partials / "partial").write_text("{{ aa }} {{ cc }}")
+            self.wait_for(destination / "a", "1 provided")
+        finally:
+            watch.terminate()
+            watch.wait()
+
+    def tearDown(self):
+        rmtree(self.test_dir, ignore_errors=True)
+
+
 class TestCli(TestCase):
     def setUp(self):
         self.test_dir = Path("test_cli")
@@ -58,7 +168,18 @@ DYNAMIC_VARS['static_vars'] = STATIC_VARS
 
         self.static = clinja.ClinjaStatic(static_file=self.static_path.resolve())
         self.dynamic = clinja.ClinjaDynamic(dynamic_file=self.dynamic_path.resolve())
-        self.obj = {"static": self.static, "dynamic": self.dynamic}
+        self.template_cache = clinja.cache.TemplateCache(
+            cache_dir=self.test_dir / "cache"
+        )
+        self.manifest = clinja.manifest.Manifest(
+            manifest_file=self.test_dir / "manifest.json"
+        )
+        self.obj = {
+            "static": self.static,
+            "dynamic": self.dynamic,
+            "template_cache": self.template_cache,
+            "manifest": self.manifest,
+        }
 
     def test_add(self):
         runner = CliRunner()
@@ -226,5 +347,418 @@ DYNAMIC_VARS['static_vars'] = STATIC_VARS
 value_missing""",
         )
 
+    def test_run_answers(self):
+        # PyYAML is optional, use a .env file
+        answers = self.test_dir / "answers.env"
+        answers.write_text("aa=2\nbb=3\ntemplate=t\nmissing=answered\n")
+
+        runner = CliRunner()
+        # every variable is answered, prompting would fail without a tty
+        for args, input in [
+            ([str(answers)], None),
+            (["-"], '{"aa": 2, "bb": 3, "template": "t", "missing": "answered"}'),
+        ]:
+            res = runner.invoke(
+                cli.run,
+                [str(self.template_path), "--answers", *args],
+                obj=self.obj,
+                input=input,
+            )
+            self.assertEqual(res.exit_code, 0)
+            self.assertEqual(
+                res.output,
+                "2\n3\nt\nanswered",
+            )
+
+        res = runner.invoke(
+            cli.run, ["-", "--answers", "-"], obj=self.obj, input="{}"
+        )
+        self.assertEqual(res.exit_code, 2)
+
+        answers.write_text("missing\n")
+        res = runner.invoke(
+            cli.run, [str(self.template_path), "--answers", str(answers)], obj=self.obj
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("Could not read" in res.output)
+
+    def test_run_include(self):
+        template = self.test_dir / "page"
+        template.write_text('{% include "header" %} {% include "footer" %}')
+        (self.test_dir / "header").write_text("{{ aa }}")
+        partials = self.test_dir / "partials"
+        partials.mkdir()
+        (partials / "footer").write_text("{{ bb }}")
+
+        runner = CliRunner()
+        res = runner.invoke(
+            cli.run,
+            [str(template), "--prompt", "never", "-I", str(partials)],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, "1 3")
+
+        res = runner.invoke(cli.run, [str(template), "--prompt", "never"], obj=self.obj)
+        self.assertEqual(res.exit_code, 1)
+
+        # the variables of the included templates are resolved too
+        (partials / "footer").write_text("{{ missing }}")
+        res = runner.invoke(
+            cli.run,
+            [str(template), "--prompt", "never", "-I", str(partials)],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertIn("missing", res.output)
+
+        # but not the ones the including template assigns
+        template.write_text(
+            '{% for item in [1, 2] %}{% include "item" %}{% endfor %}'
+        )
+        (partials / "item").write_text("{{ item }}{{ aa }}")
+        res = runner.invoke(
+            cli.run,
+            [str(template), "--prompt", "never", "-I", str(partials)],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, "1121")
+
+    def test_compile(self):
+        template_dir = self.test_dir / "templates"
+        (template_dir / "sub").mkdir(parents=True)
+        (template_dir / "top").write_text('{% include "sub/nested" %} {{ aa }}')
+        (template_dir / "sub" / "nested").write_text("{{ bb }}")
+
+        runner = CliRunner()
+        for target, args in [("compiled", []), ("compiled.zip", ["--zip"])]:
+            compiled = self.test_dir / target
+            res = runner.invoke(
+                cli.compile_, [str(template_dir), str(compiled), *args]
+            )
+            self.assertEqual(res.exit_code, 0)
+            self.assertTrue("2" in res.output)
+
+            for jobs in ["1", "2"]:
+                destination_dir = self.test_dir / "out" / target / jobs
+                res = runner.invoke(
+                    cli.run,
+                    [str(compiled), str(destination_dir), "--prompt", "never", "-j", jobs],
+                    obj=self.obj,
+                )
+                self.assertEqual(res.exit_code, 0)
+                self.assertEqual((destination_dir / "top").read_text(), "3 1")
+                self.assertEqual((destination_dir / "sub" / "nested").read_text(), "3")
+
+        (template_dir / "invalid").write_text("{% if %}")
+        res = runner.invoke(
+            cli.compile_, [str(template_dir), str(self.test_dir / "invalid")]
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("invalid:1" in res.output)
+
+    def test_run_dir(self):
+        template_dir = self.test_dir / "templates"
+        (template_dir / "sub").mkdir(parents=True)
+        (template_dir / "top").write_text("{{ aa }}")
+        (template_dir / "sub" / "nested").write_text("{{ bb }} {{ template }}")
+        destination_dir = self.test_dir / "out"
+
+        runner = CliRunner()
+        res = runner.invoke(
+            cli.run,
+            [str(template_dir), str(destination_dir), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual((destination_dir / "top").read_text(), "1")
+        self.assertEqual(
+            (destination_dir / "sub" / "nested").read_text(),
+            f"3 {template_dir.resolve()}",
+        )
+
+        res = runner.invoke(
+            cli.run, [str(template_dir), "--prompt", "never"], obj=self.obj
+        )
+        self.assertEqual(res.exit_code, 2)
+
+        res = runner.invoke(
+            cli.run,
+            [str(self.test_dir / "missing"), str(destination_dir)],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 2)
+
+        # failing templates are reported, the others are still rendered
+        (template_dir / "broken").write_text("{{ aa | missing_filter }}")
+        (template_dir / "failing").write_text("{{ aa.missing.key }}")
+        (template_dir / "top").write_text("{{ aa }}{{ aa }}")
+        res = runner.invoke(
+            cli.run,
+            [str(template_dir), str(destination_dir), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertIn(f"{template_dir / 'broken'}: ", res.output)
+        self.assertEqual((destination_dir / "top").read_text(), "1")
+
+        (template_dir / "broken").unlink()
+        res = runner.invoke(
+            cli.run,
+            [str(template_dir), str(destination_dir), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertIn(f"{template_dir / 'failing'}: ", res.output)
+        self.assertEqual((destination_dir / "top").read_text(), "11")
+
+    def test_run_jobs(self):
+        template_dir = self.test_dir / "templates"
+        template_dir.mkdir()
+        for i in range(4):
+            (template_dir / f"template_{i}").write_text(f"{i} {{{{ aa }}}}")
+        destination_dir = self.test_dir / "out"
+
+        runner = CliRunner()
+        # the same workers parse and render
+        with patch("clinja.parallel.Pool", wraps=Pool) as pool:
+            res = runner.invoke(
+                cli.run,
+                [str(template_dir), str(destination_dir), "--prompt", "never", "-j", "2"],
+                obj=self.obj,
+            )
+        self.assertEqual(pool.call_count, 1)
+        self.assertEqual(res.exit_code, 0)
+        for i in range(4):
+            self.assertEqual((destination_dir / f"template_{i}").read_text(), f"{i} 1")
+
+        (template_dir / "template_1").write_text("{{ aa | not_a_filter }}")
+        res = runner.invoke(
+            cli.run,
+            [str(template_dir), str(destination_dir), "--prompt", "never", "-j", "2"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("template_1" in res.output)
+
+    def test_run_each(self):
+        template = self.test_dir / "host.conf"
+        template.write_text("{{ hostname }} {{ port }} {{ aa }}")
+        records = self.test_dir / "hosts.jsonl"
+        records.write_text(
+            '{"hostname": "a", "port": 80}\n\n{"hostname": "b", "port": 81}\n'
+        )
+        destination = str(self.test_dir / "out" / "{{ hostname }}.conf")
+
+        runner = CliRunner()
+        for jobs in ["1", "2"]:
+            res = runner.invoke(
+                cli.run,
+                [
+                    str(template),
+                    destination,
+                    "--each",
+                    str(records),
+                    "-j",
+                    jobs,
+                    "--prompt",
+                    "never",
+                ],
+                obj=self.obj,
+            )
+            self.assertEqual(res.exit_code, 0)
+            self.assertEqual((self.test_dir / "out" / "a.conf").read_text(), "a 80 1")
+            self.assertEqual((self.test_dir / "out" / "b.conf").read_text(), "b 81 1")
+
+        csv_records = self.test_dir / "hosts.csv"
+        csv_records.write_text("hostname,port\na,80\nb,81\n")
+        res = runner.invoke(
+            cli.run,
+            [str(template), "--each", str(csv_records), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, "a 80 1b 81 1")
+
+        # destinations must be unique
+        csv_records.write_text("hostname,port\na,80\na,81\n")
+        res = runner.invoke(
+            cli.run,
+            [str(template), destination, "--each", str(csv_records), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("Record 2" in res.output)
+
+    def test_run_skip_unchanged(self):
+        template_dir = self.test_dir / "templates"
+        template_dir.mkdir()
+        (template_dir / "a").write_text("{{ aa }}")
+        (template_dir / "b").write_text("{{ bb }}")
+        destination_dir = self.test_dir / "out"
+        destination_dir.mkdir()
+        (destination_dir / "a").write_text("1")
+        mtime = (destination_dir / "a").stat().st_mtime_ns
+
+        runner = CliRunner()
+        for jobs in ["1", "2"]:
+            res = runner.invoke(
+                cli.run,
+                [
+                    str(template_dir),
+                    str(destination_dir),
+                    "--prompt",
+                    "never",
+                    "--skip-unchanged",
+                    "-j",
+                    jobs,
+                ],
+                obj=self.obj,
+            )
+            self.assertEqual(res.exit_code, 0)
+            self.assertEqual((destination_dir / "a").stat().st_mtime_ns, mtime)
+            self.assertEqual((destination_dir / "b").read_text(), "3")
+            (destination_dir / "b").unlink()
+            self.assertTrue("1 written, 1 unchanged." in res.output)
+
+    def test_run_incremental(self):
+        template_dir = self.test_dir / "templates"
+        template_dir.mkdir()
+        (template_dir / "a").write_text("{{ aa }}")
+        (template_dir / "b").write_text("{{ bb }}")
+        (template_dir / "c").write_text("{{ aa }} {{ ab }}")
+        # only depends on the variables of the partial
+        (template_dir / "d").write_text("{% include 'partial' %}")
+        partials = self.test_dir / "partials"
+        partials.mkdir()
+        (partials / "partial").write_text("{{ aa }}")
+        destination_dir = self.test_dir / "out"
+        args = [
+            str(template_dir),
+            str(destination_dir),
+            "--prompt",
+            "never",
+            "--incremental",
+            "-I",
+            str(partials),
+        ]
+
+        runner = CliRunner()
+        for jobs in ["1", "2"]:
+            res = runner.invoke(cli.run, args + ["-j", jobs], obj=self.obj)
+            self.assertEqual(res.exit_code, 0)
+            self.assertEqual(
+                (destination_dir / "b").read_text(), str(self.static.stored["bb"])
+            )
+
+            self.static.add("bb", 4 + int(jobs), force=True)
+            (destination_dir / "c").write_text("changed by hand")
+            res = runner.invoke(cli.run, args + ["-j", jobs], obj=self.obj)
+            self.assertEqual(res.exit_code, 0)
+            self.assertTrue("2 written, 2 up to date." in res.output)
+            self.assertEqual((destination_dir / "b").read_text(), str(4 + int(jobs)))
+            self.assertEqual((destination_dir / "c").read_text(), "1 2")
+
+            res = runner.invoke(cli.run, args + ["-j", jobs], obj=self.obj)
+            self.assertTrue("0 written, 4 up to date." in res.output)
+            self.manifest.clear()
+
+    def test_run_profile(self):
+        runner = CliRunner()
+        runner.invoke(cli.add, ["missing", "value_missing"], obj=self.obj)
+        stats_file = self.test_dir / "dynamic.prof"
+        try:
+            res = runner.invoke(
+                cli.run,
+                [
+                    str(self.template_path),
+                    str(self.test_dir / "out"),
+                    "--prompt",
+                    "never",
+                    "--profile",
+                    "--profile-format",
+                    "json",
+                    "--profile-dynamic",
+                    str(stats_file),
+                ],
+                obj=self.obj,
+            )
+        finally:
+            clinja.profiling.disable()
+        self.assertEqual(res.exit_code, 0)
+        report = json.loads(res.output)
+        for phase in ["startup", "parse", "compile", "static", "dynamic", "render"]:
+            self.assertTrue(phase in report["phases"])
+        self.assertTrue(stats_file.is_file())
+
+        # the template argument isn't taken as the report format
+        try:
+            res = runner.invoke(
+                cli.run,
+                ["--profile", str(self.template_path), "--prompt", "never"],
+                obj=self.obj,
+            )
+        finally:
+            clinja.profiling.disable()
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn("startup", res.output)
+
+    def test_import(self):
+        runner = CliRunner()
+        res = runner.invoke(cli.import_, ["-"], obj=self.obj, input='{"cc": 4, "dd": 5}')
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(self.static.stored["cc"], 4)
+        self.assertEqual(self.static.stored["dd"], 5)
+
+        env_file = self.test_dir / "vars.env"
+        env_file.write_text("ee=6\naa=10\n")
+        res = runner.invoke(cli.import_, [str(env_file)], obj=self.obj)
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("'aa'" in res.output)
+        self.assertTrue("ee" not in self.static.stored)
+
+        res = runner.invoke(cli.import_, [str(env_file), "--force"], obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(self.static.stored["aa"], 10)
+        self.assertEqual(self.static.stored["ee"], 6)
+
+        res = runner.invoke(cli.import_, ["-"], obj=self.obj, input="[1, 2")
+        self.assertEqual(res.exit_code, 1)
+
+    def test_migrate(self):
+        runner = CliRunner()
+        destination = self.test_dir / "static.db"
+        res = runner.invoke(cli.migrate, [str(destination)], obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(
+            clinja.ClinjaStatic(static_file=destination).stored, self.static.stored
+        )
+
+        res = runner.invoke(cli.migrate, [str(destination)], obj=self.obj)
+        self.assertEqual(res.exit_code, 1)
+
+        res = runner.invoke(
+            cli.list, obj={**self.obj, "static": clinja.ClinjaStatic(destination)}
+        )
+        self.assertEqual(res.output, "aa: 1\nab: 2\nbb: 3\n")
+
+    def test_cache(self):
+        runner = CliRunner()
+        res = runner.invoke(cli.add, ["missing", "value_missing"], obj=self.obj)
+        res = runner.invoke(
+            cli.run,
+            [str(self.template_path), "--prompt", "never", "--cache"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        res = runner.invoke(cli.cache_stats, obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertTrue("entries: 1" in res.output)
+
+        res = runner.invoke(cli.cache_clear, obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(self.template_cache.stats()["entries"], 0)
+
     def tearDown(self):
         rmtree(self.test_dir)
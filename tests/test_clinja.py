@@ -1,13 +1,26 @@
+import gc
 import json
+import logging
 import click
 import sys
+import time
 from io import TextIOWrapper
+from multiprocessing import Pool
 from clinja.clinja import ClinjaStatic
 from clinja.clinja import ClinjaDynamic
-from unittest import TestCase
+from unittest import TestCase, mock
 from pathlib import Path
 from shutil import rmtree
 
+def add_variables(args):
+    static_file, worker = args
+    static = ClinjaStatic(static_file)
+    for i in range(25):
+        static.add(f'worker_{worker}_{i}', i)
+    static.update({f'worker_{worker}_bulk_{i}': i for i in range(5)})
+    static.remove(f'worker_{worker}_0')
+
+
 class TestClinjaStatic(TestCase):
     def setUp(self):
         self.test_dir = Path('test_clinja')
@@ -42,10 +55,71 @@ class TestClinjaStatic(TestCase):
         self.static.remove('name')
         self.assertTrue('name' not in self.static.stored.keys())
 
+    def test_update(self):
+        with self.assertRaises(ValueError):
+            self.static.update({'name': 'Jane Doe', 'partner': 'Jane Doe'})
+        self.assertTrue('partner' not in self.static.stored)
+        with self.assertRaises(ValueError):
+            self.static.update({'no spaces allowed': 1})
+
+        with mock.patch.object(self.static.storage, 'update',
+                               wraps=self.static.storage.update) as update:
+            self.static.update({'name': 'John Doe', 'a': 1, 'b': 2})
+            update.assert_called_once()
+        self.assertEqual(ClinjaStatic(self.static_file).stored,
+                         {**self.static_dict, 'a': 1, 'b': 2})
+
+        self.static.update({'name': 'Jane Doe'}, force=True)
+        self.assertEqual(self.static.stored['name'], 'Jane Doe')
+
+    def test_remove_many(self):
+        missing = self.static.remove_many(['name', 'not_in_store', 'email'])
+        self.assertEqual(missing, ['not_in_store'])
+        self.assertEqual(self.static.stored, {})
+        self.assertEqual(ClinjaStatic(self.static_file).stored, {})
+
+    def test_concurrent_writers(self):
+        with Pool(8) as pool:
+            pool.map(add_variables, [(self.static_file, i) for i in range(8)])
+        stored = ClinjaStatic(self.static_file).stored
+        self.assertEqual(len(stored), len(self.static_dict) + 8 * (24 + 5))
+        for worker in range(8):
+            self.assertEqual(stored[f'worker_{worker}_24'], 24)
+            self.assertTrue(f'worker_{worker}_0' not in stored)
+        self.assertEqual([p for p in self.test_dir.iterdir() if p.suffix == '.tmp'],
+                         [])
+
+    def test_migrate(self):
+        migrated = self.static.migrate(self.test_dir / 'migrated.db')
+        self.assertEqual(migrated.stored, self.static_dict)
+        self.assertEqual(ClinjaStatic(self.test_dir / 'migrated.db').stored,
+                         self.static_dict)
+
     def tearDown(self):
         rmtree(self.test_dir, ignore_errors=True)
 
 
+class TestClinjaStaticSqlite(TestClinjaStatic):
+    def setUp(self):
+        super().setUp()
+        self.static_file = self.test_dir / 'static.db'
+        self.static = ClinjaStatic(self.test_dir / 'static.json').migrate(
+            self.static_file)
+
+    def test_list(self):
+        self.assertEqual(list(self.static.list()), sorted(self.static_dict.items()))
+        self.assertEqual(list(self.static.list(pattern='^n')),
+                         [('name', self.static_dict['name'])])
+
+    def test_point_lookup(self):
+        self.assertEqual(self.static.storage.get('name'), 'John Doe')
+        with self.assertRaises(KeyError):
+            self.static.storage.get('not_in_store')
+        self.static.add('partner', ['Jane', 'Doe'])
+        self.assertEqual(ClinjaStatic(self.static_file).storage.get('partner'),
+                         ['Jane', 'Doe'])
+
+
 class testClinjaDynamic(TestCase):
     def setUp(self):
         self.test_dir = Path('test_clinja')
@@ -91,5 +165,165 @@ DYNAMIC_VARS['run_cwd'] = RUN_CWD
         self.assertEqual(out['destination_path'], self.test_template.resolve())
         self.assertEqual(out['run_cwd'], Path('test_run_cwd').resolve())
 
+    def test_run_providers(self):
+        with self.dynamic_file.open('a') as fp:
+            fp.write("CALLS = []\n"
+                     "def provider():\n"
+                     "    CALLS.append('provider')\n"
+                     "    return STATIC_VARS['name'] + ' Pear'\n"
+                     "DYNAMIC_PROVIDERS['provided'] = provider\n"
+                     "DYNAMIC_PROVIDERS['calls'] = lambda: CALLS\n")
+        out = self.dynamic.run(static_vars={'name': 'John'})
+        self.assertEqual(out['provided'], 'John Pear')
+        self.assertEqual(out['from_static'], 'John Apple')
+
+        out = self.dynamic.run(static_vars={'name': 'John'}, variables={'calls'})
+        self.assertTrue('provided' not in out)
+        self.assertEqual(out['calls'], [])
+        self.assertEqual(out['from_static'], 'John Apple')
+
+    def test_run_providers_concurrent(self):
+        with self.dynamic_file.open('a') as fp:
+            fp.write("import asyncio, time\n"
+                     "def sleepy():\n"
+                     "    time.sleep(0.3)\n"
+                     "    return 'sleepy'\n"
+                     "async def async_sleepy():\n"
+                     "    await asyncio.sleep(0.3)\n"
+                     "    return 'async_sleepy'\n"
+                     "DYNAMIC_PROVIDERS['sleepy_1'] = sleepy\n"
+                     "DYNAMIC_PROVIDERS['sleepy_2'] = sleepy\n"
+                     "DYNAMIC_PROVIDERS['async_sleepy'] = async_sleepy\n")
+        start = time.perf_counter()
+        out = self.dynamic.run(static_vars={'name': 'John'})
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual(out['sleepy_1'], 'sleepy')
+        self.assertEqual(out['sleepy_2'], 'sleepy')
+        self.assertEqual(out['async_sleepy'], 'async_sleepy')
+
+        self.dynamic.provider_timeout = 0.1
+        with self.assertRaises(TimeoutError):
+            self.dynamic.run(static_vars={'name': 'John'}, variables={'sleepy_1'})
+        with self.assertRaises(TimeoutError):
+            self.dynamic.run(static_vars={'name': 'John'}, variables={'async_sleepy'})
+
+    def test_run_providers_error(self):
+        cancelled = (self.test_dir / 'cancelled').resolve()
+        with self.dynamic_file.open('a') as fp:
+            fp.write("import asyncio\n"
+                     "def failing():\n"
+                     "    raise ValueError('failed')\n"
+                     "async def async_sleepy():\n"
+                     "    try:\n"
+                     "        await asyncio.sleep(0.3)\n"
+                     "    except asyncio.CancelledError:\n"
+                     f"        open({str(cancelled)!r}, 'w').close()\n"
+                     "        raise\n"
+                     "    return 'async_sleepy'\n"
+                     "DYNAMIC_PROVIDERS['async_sleepy'] = async_sleepy\n"
+                     "DYNAMIC_PROVIDERS['failing'] = failing\n")
+        # the other providers are cancelled, not left pending
+        with mock.patch.object(logging.getLogger('asyncio'), 'error') as error:
+            with self.assertRaises(ValueError):
+                self.dynamic.run(static_vars={'name': 'John'})
+            gc.collect()
+        error.assert_not_called()
+        self.assertTrue(cancelled.is_file())
+
+    def test_run_memo(self):
+        with self.dynamic_file.open('a') as fp:
+            fp.write("import time\n"
+                     "DYNAMIC_VARS['now'] = time.perf_counter()\n"
+                     "DYNAMIC_VOLATILE.append('now')\n")
+        out = self.dynamic.run(static_vars={'name': 'John'},
+                               variables={'from_static'})
+        self.assertFalse(self.dynamic.from_cache)
+        self.assertEqual(out['from_static'], 'John Apple')
+        self.assertEqual(self.dynamic.run(static_vars={'name': 'John'},
+                                          variables={'from_static'}), out)
+        self.assertTrue(self.dynamic.from_cache)
+
+        # different inputs
+        self.dynamic.run(static_vars={'name': 'Jane'}, variables={'from_static'})
+        self.assertFalse(self.dynamic.from_cache)
+
+        # volatile values are never reused
+        now = self.dynamic.run(static_vars={'name': 'John'})['now']
+        self.assertFalse(self.dynamic.from_cache)
+        self.assertNotEqual(self.dynamic.run(static_vars={'name': 'John'})['now'],
+                            now)
+        self.assertFalse(self.dynamic.from_cache)
+
+        # changed dynamic file
+        with self.dynamic_file.open('a') as fp:
+            fp.write("DYNAMIC_VARS['from_static'] = 'changed'\n")
+        out = self.dynamic.run(static_vars={'name': 'John'},
+                               variables={'from_static'})
+        self.assertFalse(self.dynamic.from_cache)
+        self.assertEqual(out['from_static'], 'changed')
+
+        dynamic = ClinjaDynamic(self.dynamic_file, memoize=False)
+        dynamic.run(static_vars={'name': 'John'}, variables={'from_static'})
+        dynamic.run(static_vars={'name': 'John'}, variables={'from_static'})
+        self.assertFalse(dynamic.from_cache)
+
+    def test_run_cache(self):
+        depend_file = self.test_dir / 'depend'
+        depend_file.write_text('1')
+        with self.dynamic_file.open('a') as fp:
+            fp.write(f"DYNAMIC_VARS['depend'] = open('{depend_file.resolve()}').read()\n"
+                     f"DYNAMIC_DEPENDS.append('{depend_file.resolve()}')\n")
+        dynamic = ClinjaDynamic(self.dynamic_file, cache_ttl=60,
+                                cache_dir=self.test_dir / 'cache',
+                                memoize=False)
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertFalse(dynamic.from_cache)
+        self.assertEqual(out['depend'], '1')
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertTrue(dynamic.from_cache)
+        self.assertEqual(out['depend'], '1')
+
+        # different inputs
+        dynamic.run(static_vars={'name': 'Jane'})
+        self.assertFalse(dynamic.from_cache)
+
+        # changed dependency
+        depend_file.write_text('22')
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertFalse(dynamic.from_cache)
+        self.assertEqual(out['depend'], '22')
+
+        # expired
+        dynamic.cache_ttl = 0
+        dynamic.run(static_vars={'name': 'John'})
+        self.assertFalse(dynamic.from_cache)
+
+        self.assertEqual(dynamic.clear_cache(), 2)
+
+    def test_run_relative_depends(self):
+        # relative to the dynamic file's directory, where it runs
+        depend_file = self.dynamic_file.parent / 'relative'
+        depend_file.write_text('1')
+        with self.dynamic_file.open('a') as fp:
+            fp.write("DYNAMIC_VARS['depend'] = open('relative').read()\n"
+                     "DYNAMIC_DEPENDS.append('relative')\n")
+        dynamic = ClinjaDynamic(self.dynamic_file, cache_ttl=60,
+                                cache_dir=self.test_dir / 'cache')
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertEqual(out['depend'], '1')
+        self.assertEqual(dynamic.depends, [str(depend_file.resolve())])
+
+        depend_file.write_text('22')
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertFalse(dynamic.from_cache)
+        self.assertEqual(out['depend'], '22')
+
+        # the disk cache too
+        dynamic.memoize = False
+        depend_file.write_text('333')
+        out = dynamic.run(static_vars={'name': 'John'})
+        self.assertFalse(dynamic.from_cache)
+        self.assertEqual(out['depend'], '333')
+
     def tearDown(self):
         rmtree(self.test_dir, ignore_errors=True)
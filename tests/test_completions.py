@@ -2,8 +2,12 @@ import os
 from pathlib import Path
 from shutil import rmtree
 from unittest import TestCase
+from unittest.mock import patch
 
-from clinja import completions
+import click
+
+from clinja import cli, completions
+from clinja.storage import open_storage
 
 
 class TestCompletions(TestCase):
@@ -40,5 +44,54 @@ class TestCompletions(TestCase):
         )
         self.assertEqual(out, [])
 
+    def test_static_file(self):
+        # once migrated, the SQLite static file is completed
+        static_db = self.test_dir / "static.db"
+        with patch("clinja.settings.STATIC_FILE", self.static_path), patch(
+            "clinja.settings.STATIC_DB_FILE", static_db
+        ):
+            self.assertEqual(set(completions.variable_names(None, ["command"], "a")),
+                             {"aa", "ab"})
+            storage = open_storage(static_db)
+            storage.update({"ac": 4})
+            self.assertEqual(set(completions.variable_names(None, ["command"], "a")),
+                             {"ac"})
+            out = completions.variable_value(None, ["command", "ac"], None)
+            self.assertEqual(out, [4])
+            # the index is rebuilt on writes to the write ahead log
+            storage.update({"ad": 5})
+            self.assertEqual(set(completions.variable_names(None, ["command"], "a")),
+                             {"ac", "ad"})
+
+    def test_shell_complete(self):
+        # click >= 8 passes the parameter, the typed arguments are parsed
+        ctx = click.Context(cli.remove, info_name="remove")
+        ctx.params = {"variable_name": ("aa",)}
+        out = completions.variable_names(
+            ctx, cli.remove.params[0], "a", static_file=self.static_path
+        )
+        self.assertEqual(out, ["ab"])
+
+        ctx = click.Context(cli.add, info_name="add")
+        ctx.params = {"variable_name": "aa", "value": (), "force": False}
+        out = completions.variable_value(
+            ctx, cli.add.params[1], "", static_file=self.static_path
+        )
+        self.assertEqual(out, ["1"])
+
+    def test_variable_index(self):
+        index = completions.VariableIndex(static_file=self.static_path)
+        self.assertEqual(index.keys(), ["aa", "ab", "bb"])
+        self.assertTrue(index.index_file.is_file())
+        self.assertEqual(index.prefixed("a"), ["aa", "ab"])
+        self.assertEqual(index.prefixed("b"), ["bb"])
+        self.assertEqual(index.prefixed("c"), [])
+        self.assertEqual(index.prefixed(""), ["aa", "ab", "bb"])
+
+        # the index is rebuilt when the static file changes
+        with self.static_path.open("w") as fp:
+            fp.write('{"aa": 1, "ac": 4}')
+        self.assertEqual(index.prefixed("a"), ["aa", "ac"])
+
     def tearDown(self):
         rmtree(self.test_dir, ignore_errors=True)
@@ -0,0 +1,64 @@
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase
+
+from jinja2 import DictLoader, Environment
+
+from clinja.manifest import Manifest, digest
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_manifest")
+        self.test_dir.mkdir(exist_ok=True)
+        self.manifest = Manifest(manifest_file=self.test_dir / "manifest.json")
+        self.destination = self.test_dir / "out"
+        self.environment = Environment(
+            loader=DictLoader({"base": "{% include 'nested' %}", "nested": "{{ a }}"})
+        )
+
+    def test_entry(self):
+        entry = self.manifest.entry(
+            digest("{{ a }}"), {"a"}, [], {"a": 1, "b": 2}, self.environment
+        )
+        other = self.manifest.entry(
+            digest("{{ a }}"), {"a"}, [], {"a": 1, "b": 3}, self.environment
+        )
+        self.assertEqual(entry, other)
+        other = self.manifest.entry(
+            digest("{{ a }}"), {"a"}, [], {"a": 2}, self.environment
+        )
+        self.assertNotEqual(entry, other)
+
+        entry = self.manifest.entry(
+            digest(""), set(), ["base"], {"a": 1}, self.environment
+        )
+        self.assertEqual(set(entry["includes"]), {"base", "nested"})
+        # only the variables of the template and the templates it references
+        entry = self.manifest.entry(
+            digest(""), {"a"}, ["base"], {"a": 1, "b": 2}, self.environment
+        )
+        other = self.manifest.entry(
+            digest(""), {"a"}, ["base"], {"a": 1, "b": 3}, self.environment
+        )
+        self.assertEqual(entry, other)
+        entry = self.manifest.entry(digest(""), set(), [None], {}, self.environment)
+        self.assertIsNone(entry["includes"])
+
+    def test_is_fresh(self):
+        entry = self.manifest.entry(digest("a"), set(), [], {}, self.environment)
+        self.assertFalse(self.manifest.is_fresh(self.destination, entry))
+        self.destination.write_text("a")
+        self.manifest.set(self.destination, entry)
+        self.manifest.save()
+
+        manifest = Manifest(manifest_file=self.manifest.manifest_file)
+        self.assertTrue(manifest.is_fresh(self.destination, entry))
+        self.destination.write_text("ab")
+        self.assertFalse(manifest.is_fresh(self.destination, entry))
+
+        self.assertEqual(manifest.clear(), 1)
+        self.assertFalse(self.manifest.manifest_file.exists())
+
+    def tearDown(self):
+        rmtree(self.test_dir, ignore_errors=True)
@@ -0,0 +1,50 @@
+import json
+from io import StringIO
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase
+
+from clinja import profiling
+
+
+class TestProfiling(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_profiling")
+        self.test_dir.mkdir(exist_ok=True)
+
+    def test_phase(self):
+        with profiling.phase("disabled"):
+            pass
+        profiling.enable()
+        with profiling.phase("parse"):
+            pass
+        with profiling.phase("parse"):
+            pass
+        profiling.add("render", 0.5)
+        report = json.loads(profiling.report("json"))
+        self.assertEqual(list(report["phases"]), ["startup", "parse", "render"])
+        self.assertEqual(report["phases"]["parse"]["calls"], 2)
+        self.assertEqual(report["phases"]["render"]["seconds"], 0.5)
+        text = profiling.report()
+        self.assertTrue("render" in text and "total" in text)
+        profiling.reset()
+        self.assertEqual(json.loads(profiling.report("json"))["phases"], {})
+
+    def test_timed_writer(self):
+        fp = StringIO()
+        writer = profiling.TimedWriter(fp)
+        writer.write("a")
+        writer.write("b")
+        self.assertEqual(fp.getvalue(), "ab")
+        self.assertTrue(writer.seconds > 0)
+
+    def test_profiled(self):
+        self.assertEqual(profiling.profiled(sum, [1, 2]), 3)
+        stats_file = self.test_dir / "stats"
+        profiling.enable(dynamic_stats_file=stats_file)
+        self.assertEqual(profiling.profiled(sum, [1, 2]), 3)
+        self.assertTrue(stats_file.is_file())
+
+    def tearDown(self):
+        profiling.disable()
+        rmtree(self.test_dir, ignore_errors=True)
@@ -0,0 +1,48 @@
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase, mock
+
+from myopy import PyFile
+
+from clinja import pyfile
+from clinja.pyfile import CachedPyFile
+
+
+class TestCachedPyFile(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_pyfile")
+        self.test_dir.mkdir(exist_ok=True)
+        self.python_file = self.test_dir / "dynamic.py"
+        self.python_file.write_text("VALUE = 1\n")
+        self.code_cache_dir = self.test_dir / "code"
+        pyfile._CODE.clear()
+
+    def run_file(self):
+        return CachedPyFile(self.python_file, code_cache_dir=self.code_cache_dir).run()
+
+    def test_run(self):
+        self.assertEqual(self.run_file().VALUE, 1)
+        self.assertEqual(len([*self.code_cache_dir.iterdir()]), 1)
+
+        # compiled once per process
+        with mock.patch.object(PyFile, "_compile") as compile_:
+            self.assertEqual(self.run_file().VALUE, 1)
+            # then loaded from disk
+            pyfile._CODE.clear()
+            self.assertEqual(self.run_file().VALUE, 1)
+        compile_.assert_not_called()
+
+        self.python_file.write_text("VALUE = 22\n")
+        self.assertEqual(self.run_file().VALUE, 22)
+        # a single entry per file
+        self.assertEqual(len([*self.code_cache_dir.iterdir()]), 1)
+
+        # corrupt entries are ignored
+        for path in self.code_cache_dir.iterdir():
+            path.write_bytes(b"corrupt")
+        pyfile._CODE.clear()
+        self.assertEqual(self.run_file().VALUE, 22)
+
+    def tearDown(self):
+        pyfile._CODE.clear()
+        rmtree(self.test_dir, ignore_errors=True)
@@ -0,0 +1,98 @@
+import os
+import time
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from clinja import cli
+from clinja.clinja import ClinjaDynamic, ClinjaStatic
+from clinja.sandbox import DynamicWorker
+
+
+class TestDynamicWorker(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_sandbox")
+        self.test_dir.mkdir(exist_ok=True)
+        self.dynamic_file = self.test_dir / "dynamic.py"
+        self.dynamic_file.write_text(
+            "import os\n"
+            "DYNAMIC_VARS['pid'] = os.getpid()\n"
+            "DYNAMIC_VARS['name'] = STATIC_VARS['name']\n"
+            "DYNAMIC_DEPENDS.append('depend')\n"
+            "DYNAMIC_PROVIDERS['provided'] = lambda: 'provided'\n"
+        )
+        self.worker = DynamicWorker(timeout=5)
+        self.dynamic = ClinjaDynamic(
+            self.dynamic_file, memoize=False, worker=self.worker
+        )
+
+    def test_run(self):
+        out = self.dynamic.run(static_vars={"name": "John"})
+        self.assertEqual(out["name"], "John")
+        self.assertEqual(out["provided"], "provided")
+        self.assertEqual(
+            self.dynamic.depends, [str((self.test_dir / "depend").resolve())]
+        )
+        self.assertNotEqual(out["pid"], os.getpid())
+        # the worker is reused
+        self.assertEqual(self.dynamic.run(static_vars={"name": "Jane"})["pid"], out["pid"])
+
+        # errors of the dynamic file are raised in this process
+        with self.assertRaises(KeyError):
+            self.dynamic.run()
+
+    def test_limits(self):
+        self.dynamic_file.write_text(
+            "import time\n"
+            "if STATIC_VARS.get('sleep'):\n"
+            "    time.sleep(10)\n"
+            "if STATIC_VARS.get('spin'):\n"
+            "    while True:\n"
+            "        pass\n"
+            "if STATIC_VARS.get('allocate'):\n"
+            "    data = bytearray(4 * 1024 ** 3)\n"
+            "DYNAMIC_VARS['ok'] = True\n"
+        )
+        self.worker.timeout = 0.5
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            self.dynamic.run(static_vars={"sleep": True})
+        self.assertLess(time.perf_counter() - start, 5)
+        # a new worker takes over
+        self.assertTrue(self.dynamic.run()["ok"])
+
+        self.worker.timeout = None
+        self.worker.cpu_limit = 1
+        with self.assertRaises(TimeoutError):
+            self.dynamic.run(static_vars={"spin": True})
+        self.assertTrue(self.dynamic.run()["ok"])
+
+        self.worker.close()
+        self.worker.memory_limit = 2 * 1024 ** 3
+        with self.assertRaises(MemoryError):
+            self.dynamic.run(static_vars={"allocate": True})
+        self.assertTrue(self.dynamic.run()["ok"])
+
+    def test_cli(self):
+        self.dynamic_file.write_text("data = bytearray(4 * 1024 ** 3)\n")
+        static_file = self.test_dir / "static.json"
+        static_file.write_text("{}")
+        template = self.test_dir / "template"
+        template.write_text("{{ data }}")
+        self.worker.memory_limit = 2 * 1024 ** 3
+        obj = {"static": ClinjaStatic(static_file), "dynamic": self.dynamic}
+
+        # the limits are reported as errors
+        runner = CliRunner()
+        res = runner.invoke(cli.run, [str(template), "--prompt", "never"], obj=obj)
+        self.assertEqual(res.exit_code, 1)
+        self.assertIn("memory limit", res.output)
+        res = runner.invoke(cli.test, obj=obj)
+        self.assertEqual(res.exit_code, 1)
+        self.assertIn("memory limit", res.output)
+
+    def tearDown(self):
+        self.worker.close()
+        rmtree(self.test_dir, ignore_errors=True)
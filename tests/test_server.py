@@ -0,0 +1,212 @@
+from pathlib import Path
+from shutil import rmtree
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from clinja import cli, profiling
+from clinja.client import ClinjaClient
+from clinja.clinja import ClinjaDynamic, ClinjaStatic
+from clinja.server import ClinjaServer
+
+
+class TestServer(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_server")
+        self.test_dir.mkdir(exist_ok=True)
+        self.static_path = self.test_dir / "static.json"
+        self.static_path.write_text('{"aa": 1, "bb": 2}')
+        self.dynamic_path = self.test_dir / "dynamic.py"
+        self.dynamic_path.write_text("DYNAMIC_VARS['template'] = TEMPLATE\n")
+        self.template_path = self.test_dir / "template"
+        self.template_path.write_text("{{ aa }} {{ template }} {{ missing }}")
+        self.socket_file = self.test_dir / "clinja.sock"
+
+        self.server = ClinjaServer(
+            {
+                "static": ClinjaStatic(static_file=self.static_path),
+                "dynamic": ClinjaDynamic(dynamic_file=self.dynamic_path),
+            },
+            socket_file=self.socket_file,
+        )
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = ClinjaClient(socket_file=self.socket_file)
+        # the cli's obj, without the static and dynamic sources, all requests
+        # should go through the daemon
+        self.obj = {"client": self.client}
+
+    def test_connect(self):
+        self.assertTrue(self.client.connect())
+        self.client.close()
+        self.assertFalse(ClinjaClient(self.test_dir / "not_a_socket").connect())
+
+    def test_request(self):
+        with self.client:
+            self.client.connect()
+            res = self.client.request("list", pattern="a")
+            self.assertEqual(res, {"items": [["aa", 1]]})
+            res = self.client.request("not_a_command")
+            self.assertTrue("error" in res)
+
+    def test_list(self):
+        runner = CliRunner()
+        res = runner.invoke(cli.list, obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, "aa: 1\nbb: 2\n")
+
+    def test_add(self):
+        runner = CliRunner()
+        res = runner.invoke(cli.add, ["cc", "3"], obj=self.obj)
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(ClinjaStatic(self.static_path).stored["cc"], 3)
+
+        res = runner.invoke(cli.add, ["cc", "4"], obj=self.obj, input="y\n")
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(ClinjaStatic(self.static_path).stored["cc"], 4)
+
+    def test_run(self):
+        runner = CliRunner()
+        res = runner.invoke(
+            cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+        )
+        self.assertEqual(res.exit_code, 1)
+        self.assertTrue("missing" in res.output)
+
+        # the daemon picks up changes to the static file
+        runner.invoke(cli.add, ["missing", "value"], obj=self.obj)
+        res = runner.invoke(
+            cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, f"1 {self.template_path.resolve()} value")
+
+        destination = self.test_dir / "out" / "destination"
+        res = runner.invoke(
+            cli.run,
+            [str(self.template_path), str(destination), "--prompt", "never"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(
+            destination.read_text(), f"1 {self.template_path.resolve()} value"
+        )
+
+    def test_run_answers(self):
+        answers = self.test_dir / "answers.json"
+        answers.write_text('{"missing": "answered"}')
+        runner = CliRunner()
+        res = runner.invoke(
+            cli.run,
+            [str(self.template_path), "--answers", str(answers), "--prompt", "missing"],
+            obj=self.obj,
+        )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, f"1 {self.template_path.resolve()} answered")
+
+    def test_run_local(self):
+        # the options the daemon doesn't know about are honoured locally
+        local_dynamic = self.test_dir / "local_dynamic.py"
+        local_dynamic.write_text("DYNAMIC_VARS['template'] = 'local'\n")
+        self.template_path.write_text("{{ aa }} {{ template }}")
+        stats_file = self.test_dir / "dynamic.prof"
+        runner = CliRunner()
+        for args, options in [
+            (["--profile-dynamic", str(stats_file)], {}),
+            (["--buffer-size", "2"], {}),
+            ([], {"provider_timeout": 10}),
+        ]:
+            obj = {
+                **self.obj,
+                "static": ClinjaStatic(static_file=self.static_path),
+                "dynamic": ClinjaDynamic(dynamic_file=local_dynamic, **options),
+            }
+            try:
+                res = runner.invoke(
+                    cli.run,
+                    [str(self.template_path), "--prompt", "never", *args],
+                    obj=obj,
+                )
+            finally:
+                profiling.disable()
+            self.assertEqual(res.exit_code, 0)
+            self.assertEqual(res.output, "1 local")
+        self.assertTrue(stats_file.is_file())
+
+    def test_run_volatile(self):
+        # a value the dynamic file doesn't declare as a dependency, it is only
+        # read again across requests when it is volatile
+        external = (self.test_dir / "external").resolve()
+        external.write_text("old")
+        self.template_path.write_text("{{ external }}")
+        runner = CliRunner()
+        for volatile, expected in [(False, "old"), (True, "new")]:
+            self.dynamic_path.write_text(
+                f"DYNAMIC_VARS['external'] = open({str(external)!r}).read()\n"
+                f"if {volatile}: DYNAMIC_VOLATILE.append('external')\n"
+            )
+            external.write_text("old")
+            res = runner.invoke(
+                cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+            )
+            self.assertEqual(res.output, "old")
+
+            external.write_text("new")
+            res = runner.invoke(
+                cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+            )
+            self.assertEqual(res.output, expected)
+
+    def test_static_db(self):
+        static_db = self.test_dir / "static.db"
+        ClinjaStatic(static_file=static_db).add("aa", 1)
+        self.server.obj["static"] = ClinjaStatic(static_file=static_db)
+        self.template_path.write_text("{{ aa }}")
+        runner = CliRunner()
+        res = runner.invoke(
+            cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+        )
+        self.assertEqual(res.output, "1")
+
+        # the writes of another process go to the write ahead log, the
+        # database file itself is unchanged
+        state = static_db.stat()
+        ClinjaStatic(static_file=static_db).add("aa", 2, force=True)
+        self.assertEqual(static_db.stat().st_mtime_ns, state.st_mtime_ns)
+        res = runner.invoke(
+            cli.run, [str(self.template_path), "--prompt", "never"], obj=self.obj
+        )
+        self.assertEqual(res.output, "2")
+
+    def test_run_prompt(self):
+        served = []
+
+        def prompt(*args, **kwargs):
+            # other clients are served while prompting
+            def request():
+                with ClinjaClient(socket_file=self.socket_file) as client:
+                    client.connect()
+                    served.append(client.request("list", pattern="bb"))
+
+            thread = Thread(target=request, daemon=True)
+            thread.start()
+            thread.join(timeout=5)
+            return "prompted"
+
+        runner = CliRunner()
+        with patch("clinja.cli.prompt_tty", side_effect=prompt):
+            res = runner.invoke(
+                cli.run,
+                [str(self.template_path), "--prompt", "missing"],
+                obj=self.obj,
+            )
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.output, f"1 {self.template_path.resolve()} prompted")
+        self.assertEqual(served, [{"items": [["bb", 2]]}])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.test_dir, ignore_errors=True)
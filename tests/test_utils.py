@@ -1,7 +1,7 @@
 import click
-from io import TextIOWrapper
+from io import StringIO, TextIOWrapper
 from pathlib import Path
-from unittest import TestCase
+from unittest import TestCase, mock
 from shutil import rmtree
 from click.testing import CliRunner
 
@@ -31,6 +31,51 @@ class TestUtils(TestCase):
         # with self.assertRaises(SyntaxError):
         #     utils.literal_eval_or_string('[1')
 
+    def test_parse_env(self):
+        contents = """
+# comment
+A=1
+export B="some string"
+C='["a", "b"]'
+D=
+"""
+        self.assertEqual(utils.parse_env(contents),
+                         {'A': 1, 'B': 'some string', 'C': ['a', 'b'], 'D': ''})
+        with self.assertRaises(ValueError):
+            utils.parse_env('not a pair')
+
+    def test_load_variables(self):
+        self.assertEqual(utils.load_variables(StringIO('{"a": [1]}')), {'a': [1]})
+        self.assertEqual(utils.load_variables(StringIO('a=1'), fmt='env'), {'a': 1})
+        with self.assertRaises(ValueError):
+            utils.load_variables(StringIO('[1, 2]'))
+
+    def test_guess_format(self):
+        self.assertEqual(utils.guess_format(Path('vars.yml')), 'yaml')
+        self.assertEqual(utils.guess_format(Path('.env')), 'env')
+        self.assertEqual(utils.guess_format(Path('-')), 'json')
+
+    def test_prompt_tty(self):
+        utils._TTY = StringIO('h\u00e9llo\n\n42\n')
+        try:
+            self.assertEqual(utils.prompt_tty('a', default=None), 'h\u00e9llo')
+            self.assertEqual(utils.prompt_tty('b', default='default'), 'default')
+            self.assertEqual(utils.prompt_tty('c', default=None,
+                                              value_proc=int), 42)
+            # Ctrl-D
+            self.assertEqual(utils.prompt_tty('d', default=None), '')
+        finally:
+            utils._TTY = None
+
+    def test_is_compiled(self):
+        test_dir = Path('test_utils_compiled')
+        test_dir.mkdir(exist_ok=True)
+        self.assertFalse(utils.is_compiled(test_dir))
+        self.assertFalse(utils.is_compiled(utils.STDIO))
+        (test_dir / 'clinja_templates.json').write_text('{}')
+        self.assertTrue(utils.is_compiled(test_dir))
+        rmtree(test_dir, ignore_errors=True)
+
     def test_f_docstring(self):
         @utils.f_docstring(f'{1+1}')
         def func_test():
@@ -38,6 +83,77 @@ class TestUtils(TestCase):
         self.assertEqual(func_test.__doc__, '2')
         self.assertTrue(func_test())
 
+    def test_walk_templates(self):
+        test_dir = Path('test_utils_walk')
+        (test_dir / 'sub').mkdir(parents=True, exist_ok=True)
+        (test_dir / 'b').touch()
+        (test_dir / 'sub' / 'a').touch()
+        out = list(utils.walk_templates(test_dir, Path('out')))
+        self.assertEqual(out, [(test_dir / 'b', Path('out/b')),
+                               (test_dir / 'sub' / 'a', Path('out/sub/a'))])
+        rmtree(test_dir, ignore_errors=True)
+
+    def test_read_records(self):
+        test_dir = Path('test_utils_records')
+        test_dir.mkdir(exist_ok=True)
+        (test_dir / 'records.jsonl').write_text('{"a": 1}\n\n{"a": [2]}\n')
+        (test_dir / 'records.csv').write_text('a,b\n1,x\n2,y\n')
+        (test_dir / 'invalid.jsonl').write_text('[1]\n')
+        self.assertEqual(list(utils.read_records(test_dir / 'records.jsonl')),
+                         [{'a': 1}, {'a': [2]}])
+        self.assertEqual(list(utils.read_records(test_dir / 'records.csv')),
+                         [{'a': '1', 'b': 'x'}, {'a': '2', 'b': 'y'}])
+        with self.assertRaises(ValueError):
+            list(utils.read_records(test_dir / 'invalid.jsonl'))
+        rmtree(test_dir, ignore_errors=True)
+
+    def test_write_atomic(self):
+        test_dir = Path('test_utils_write')
+        test_dir.mkdir(exist_ok=True)
+        path = test_dir / 'file'
+        self.assertTrue(utils.write_atomic(path, lambda fp: fp.write('a')))
+        self.assertEqual(path.read_text(), 'a')
+        path.chmod(0o640)
+        mtime = path.stat().st_mtime_ns
+        self.assertFalse(utils.write_atomic(path, lambda fp: fp.write('a'),
+                                            skip_unchanged=True))
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+        self.assertTrue(utils.write_atomic(path, lambda fp: fp.write('b'),
+                                           skip_unchanged=True))
+        self.assertEqual(path.read_text(), 'b')
+        self.assertEqual(path.stat().st_mode & 0o777, 0o640)
+        self.assertTrue(utils.write_atomic(path, lambda fp: fp.write('b')))
+
+        def failing(fp):
+            fp.write('c')
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            utils.write_atomic(path, failing)
+        self.assertEqual(path.read_text(), 'b')
+        self.assertEqual([p.name for p in test_dir.iterdir()], ['file'])
+
+        link = test_dir / 'link'
+        link.symlink_to('file')
+        utils.write_atomic(link, lambda fp: fp.write('d'))
+        self.assertTrue(link.is_symlink())
+        self.assertEqual(path.read_text(), 'd')
+
+        # the directory isn't writable, the file is written in place
+        inode = path.stat().st_ino
+        with mock.patch('tempfile.mkstemp', side_effect=PermissionError):
+            self.assertTrue(utils.write_atomic(path, lambda fp: fp.write('e')))
+            self.assertEqual(path.read_text(), 'e')
+            self.assertEqual(path.stat().st_ino, inode)
+            mtime = path.stat().st_mtime_ns
+            self.assertFalse(utils.write_atomic(path, lambda fp: fp.write('e'),
+                                                skip_unchanged=True))
+            self.assertEqual(path.stat().st_mtime_ns, mtime)
+            with self.assertRaises(ValueError):
+                utils.write_atomic(path, failing)
+            self.assertEqual(path.read_text(), 'e')
+        rmtree(test_dir, ignore_errors=True)
+
     def test_bold(self):
         self.assertEqual(utils.bold('bla'), '\x1b[1mbla\x1b[0m')
 
@@ -69,6 +185,35 @@ something
         template = utils.Template(io_wrapper)
         self.assertEqual(template.get_vars(), {'var1', 'var2', 'var3'})
 
+    def test_dump(self):
+        io_wrapper = TextIOWrapper(self.template.open('rb'))
+        template = utils.Template(io_wrapper)
+        variables = {'var1': 'a', 'var2': True, 'var3': range(100)}
+        for buffer_size in [1, 5]:
+            out = StringIO()
+            template.dump(variables, out, buffer_size=buffer_size)
+            self.assertEqual(out.getvalue(), template.render(variables))
+
+    def test_environment(self):
+        from clinja.template import get_environment
+        partials = self.test_dir / 'partials'
+        partials.mkdir()
+        (partials / 'header').write_text('header {{ var1 }}')
+        environment = get_environment([partials.resolve()])
+        self.assertIs(get_environment(), environment)
+        loader = environment.loader
+        # same search path, the loader and its cached templates are kept
+        self.assertIs(get_environment([partials.resolve()]).loader, loader)
+
+        template = utils.Template(StringIO('{% include "header" %}!'))
+        self.assertEqual(template.render(var1='a'), 'header a!')
+        # included templates are compiled once
+        self.assertIs(environment.get_template('header'),
+                      environment.get_template('header'))
+
+        get_environment([])
+        self.assertIsNot(get_environment().loader, loader)
+
     def tearDown(self):
         rmtree(self.test_dir, ignore_errors=True)
 
@@ -0,0 +1,54 @@
+import time
+from pathlib import Path
+from shutil import rmtree
+from threading import Thread
+from unittest import TestCase
+
+from clinja.watch import Watcher
+
+
+class TestWatcher(TestCase):
+    def setUp(self):
+        self.test_dir = Path("test_watch")
+        (self.test_dir / "tree").mkdir(parents=True, exist_ok=True)
+        self.file = self.test_dir / "file"
+        self.file.write_text("a")
+
+    def test_wait(self):
+        for use_inotify in [True, False]:
+            with Watcher(
+                [self.test_dir / "tree", self.file, self.test_dir / "missing"],
+                use_inotify=use_inotify,
+            ) as watcher:
+                self.assertEqual(watcher.wait(timeout=0.05), set())
+
+                def change():
+                    time.sleep(0.05)
+                    self.file.write_text("ab")
+                    (self.test_dir / "tree" / "sub").mkdir(exist_ok=True)
+                    (self.test_dir / "tree" / "sub" / "new").write_text("")
+
+                thread = Thread(target=change)
+                thread.start()
+                changed = watcher.wait(timeout=5)
+                thread.join()
+                self.assertEqual(
+                    changed,
+                    {
+                        self.file.absolute(),
+                        (self.test_dir / "tree" / "sub" / "new").absolute(),
+                    },
+                )
+
+                (self.test_dir / "missing").write_text("")
+                self.assertEqual(
+                    watcher.wait(timeout=5), {(self.test_dir / "missing").absolute()}
+                )
+                (self.test_dir / "missing").unlink()
+                self.assertEqual(
+                    watcher.wait(timeout=5), {(self.test_dir / "missing").absolute()}
+                )
+            rmtree(self.test_dir / "tree" / "sub")
+
+    def tearDown(self):
+        rmtree(self.test_dir, ignore_errors=True)